@@ -0,0 +1,155 @@
+"""
+Benchmark the HTML parsing backend over saved listing pages of each HTML
+scraped provider, comparing a full html.parser tree (how pages used to be
+parsed) against html_parsing.parse_html with the scraper's node filter.
+Besides the number of product nodes, the fields each scraper reads from
+them (product names and ids, or set links) must come out the same.
+
+Save a few pages per provider once:
+    python scripts/benchmark_html_parsing.py fixtures/html --record --pages 3
+
+Then benchmark them offline:
+    python scripts/benchmark_html_parsing.py fixtures/html
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+import gatherer_original_printing_details_generator as gatherer
+import load_new_products as lnp
+from html_parsing import PARSER, parse_html
+
+
+def miniaturemarket_fields(div):
+    return (
+        div.find("input", attrs={"name": "product-name"}).get("value"),
+        div.find("input", attrs={"name": "product-id"}).get("value"),
+    )
+
+
+def coolstuffinc_fields(div):
+    return (
+        div.find("span", attrs={"itemprop": "name"}).get_text(),
+        div.find("link", attrs={"itemprop": "url"}).get("content"),
+    )
+
+
+def trollandtoad_fields(div):
+    return (
+        div.find("div", attrs={"class": "col-11 prod-title"}).get_text().strip(),
+        div.find("a", attrs={"class": "card-text"}).get("href"),
+    )
+
+
+def gatherer_fields(a_tag):
+    return a_tag.get("href")
+
+
+# provider -> (listing url, node filter, selector of the product nodes,
+# fields the scraper reads from a product node)
+PROVIDERS = {
+    "miniaturemarket": (
+        lnp.MINIATUREMARKET_URL,
+        lnp.MINIATUREMARKET_NODES,
+        ("div", {"class": "card-body"}),
+        miniaturemarket_fields,
+    ),
+    "coolstuffinc": (
+        lnp.COOLSTUFFINC_URL,
+        lnp.COOLSTUFFINC_NODES,
+        ("div", {"class": "row product-search-row main-container"}),
+        coolstuffinc_fields,
+    ),
+    "trollandtoad": (
+        lnp.TROLLANDTOAD_URL,
+        lnp.TROLLANDTOAD_NODES,
+        ("div", {"class": "product-info card-body col pl-0 pl-sm-3"}),
+        trollandtoad_fields,
+    ),
+    "gatherer": (
+        "https://gatherer.wizards.com/sets?page={}",
+        gatherer.LINK_NODES,
+        ("a", {}),
+        gatherer_fields,
+    ),
+}
+
+
+def record(fixtures, pages):
+    for provider, (url, _, _, _) in PROVIDERS.items():
+        provider_dir = fixtures.joinpath(provider)
+        provider_dir.mkdir(parents=True, exist_ok=True)
+        for page in range(1, pages + 1):
+            r = lnp.http_get(url.format(page), headers={"User-Agent": "curl/8.6"})
+            provider_dir.joinpath(f"page-{page}.html").write_bytes(r.content)
+        print(f"Saved {pages} page(s) for {provider}")
+
+
+def time_parse(pages, parse, selector, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        found = sum(len(parse(page).find_all(*selector)) for page in pages)
+    return (time.process_time() - start) / (repeat * len(pages)), found
+
+
+def extract(pages, parse, selector, fields):
+    """What the scraper reads from every product node of `pages`, None for
+    the nodes it skips as malformed."""
+    extracted = []
+    for page in pages:
+        for node in parse(page).find_all(*selector):
+            try:
+                extracted.append(fields(node))
+            except Exception:
+                extracted.append(None)
+    return extracted
+
+
+def benchmark(fixtures, repeat):
+    print(f"Backend: {PARSER}")
+    for provider, (_, nodes, selector, fields) in PROVIDERS.items():
+        pages = [p.read_bytes() for p in sorted(fixtures.joinpath(provider).glob("*.html"))]
+        if not pages:
+            print(f"  {provider:<16} no fixture pages, skipped")
+            continue
+
+        full, full_found = time_parse(
+            pages, lambda page: BeautifulSoup(page, "html.parser"), selector, repeat
+        )
+        fast, fast_found = time_parse(
+            pages, lambda page: parse_html(page, nodes), selector, repeat
+        )
+        full_fields = extract(pages, lambda page: BeautifulSoup(page, "html.parser"), selector, fields)
+        fast_fields = extract(pages, lambda page: parse_html(page, nodes), selector, fields)
+
+        mismatch = ""
+        if full_found != fast_found:
+            mismatch = f"  MISMATCH {full_found} != {fast_found} nodes"
+        elif full_fields != fast_fields:
+            differing = sum(a != b for a, b in zip(full_fields, fast_fields))
+            mismatch = f"  MISMATCH {differing} node(s) with different fields"
+        print(
+            f"  {provider:<16} {len(pages)} page(s), {fast_found} nodes: "
+            f"{full * 1000:7.1f}ms -> {fast * 1000:6.1f}ms CPU/page "
+            f"({full / fast:4.1f}x){mismatch}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers' HTML parsing.")
+    parser.add_argument("fixtures", type=Path, help="Directory of <provider>/*.html pages")
+    parser.add_argument("--record", action="store_true", help="Download fresh fixture pages")
+    parser.add_argument("--pages", type=int, default=3, help="Pages to record per provider")
+    parser.add_argument("--repeat", type=int, default=5, help="Parses of each page to time")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.fixtures, args.pages)
+    benchmark(args.fixtures, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark the load_new_products providers offline, against responses
+replayed by a local stand-in server (see replay_server.py).
+
+Record fixtures once, with the same auth blob load_new_products takes:
+    python scripts/benchmark_providers.py --record --secret '{"ct_token": ...}'
+
+Then replay them as often as needed, e.g. with 200ms of latency per request,
+5% of injected server errors and a cap of 8 requests per host:
+    python scripts/benchmark_providers.py --latency 0.2 --error-rate 0.05 --max-per-host 8
+
+Only the providers whose auth is in --secret run. Neither mode goes through
+the response cache, so every request is recorded or replayed.
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import load_new_products as lnp
+from replay_server import FIXTURES_DIR, RecordingAdapter, ReplayAdapter, ReplayServer, Uncached
+from retryable_session import retryable_session
+from tag_matcher import skip_stats
+
+
+def use_session(adapter, max_per_host):
+    """Route the scrapers' requests through `adapter`, with `max_per_host`
+    concurrent requests per marketplace host."""
+    session = retryable_session(pool_maxsize=max_per_host)
+    session.headers["User-Agent"] = lnp.session.headers["User-Agent"]
+    # Keep the session's retry policy on the replacing adapter
+    adapter.max_retries = session.get_adapter("https://").max_retries
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    lnp.MAX_REQUESTS_PER_HOST = max_per_host
+    lnp.host_slots.clear()
+    lnp.session = session
+    lnp.http = Uncached(session)
+
+
+def enabled_providers(selected, secret):
+    providers = {}
+    for key, provider in lnp.providers_dict.items():
+        if selected and key not in selected:
+            continue
+        if provider.get("auth") and not all(auth_key in secret for auth_key in provider["auth"]):
+            print(f"{key} is skipped due missing auth")
+            continue
+        providers[key] = provider
+    return providers
+
+
+def run(providers, secret, concurrent):
+    for provider in providers.values():
+        if provider.get("preload_func") is not None:
+            provider["preload_func"](secret)
+
+    start = time.perf_counter()
+    if concurrent:
+        with ThreadPoolExecutor(max_workers=max(len(providers), 1)) as executor:
+            futures = {
+                key: executor.submit(lnp.run_provider, key, provider, secret)
+                for key, provider in providers.items()
+            }
+        results = {key: future.result() for key, future in futures.items()}
+    else:
+        results = {
+            key: lnp.run_provider(key, provider, secret) for key, provider in providers.items()
+        }
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed):
+    stats = lnp.request_stats
+    print("Provider throughput:")
+    print(f"  {'provider':<16} {'products':>8} {'requests':>8} {'seconds':>8} {'products/s':>10} {'requests/s':>10}")
+    for key, (products, seconds, error) in results.items():
+        requests_made = stats.cached[key] + len(stats.latencies[key])
+        if error:
+            print(f"  {key:<16} FAILED {error!r}")
+            continue
+        print(
+            f"  {key:<16} {len(products):>8} {requests_made:>8} {seconds:>8.2f} "
+            f"{len(products) / seconds:>10.1f} {requests_made / seconds:>10.1f}"
+        )
+    total = sum(len(products) for products, _, error in results.values() if not error)
+    print(f"  {'all':<16} {total:>8} {'':>8} {elapsed:>8.2f} {total / elapsed:>10.1f}")
+    stats.report()
+    skip_stats.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the marketplace providers offline.")
+    parser.add_argument("providers", nargs="*", help="Providers to run (default: all)")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR, help="Fixtures directory")
+    parser.add_argument("--record", action="store_true", help="Record fresh fixtures from the marketplaces")
+    parser.add_argument("--secret", default="{}", help="Auth JSON, as given to load_new_products")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each replayed response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many random extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of replayed requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of the injected errors")
+    parser.add_argument("--max-per-host", type=int, default=lnp.MAX_REQUESTS_PER_HOST, help="Concurrent requests per host")
+    parser.add_argument("--concurrent", action="store_true", help="Run the providers concurrently, as load_new_products does")
+    parser.add_argument("--seed", type=int, help="Seed of the injected latency and errors")
+    args = parser.parse_args()
+
+    unknown = set(args.providers) - lnp.providers_dict.keys()
+    if unknown:
+        print(f"Unknown providers {', '.join(sorted(unknown))}. Available: {', '.join(lnp.providers_dict)}")
+        sys.exit(1)
+    secret = json.loads(args.secret)
+    providers = enabled_providers(set(args.providers), secret)
+
+    if args.record:
+        adapter = RecordingAdapter(args.fixtures, label=lnp.current_provider.get, pool_maxsize=args.max_per_host)
+        use_session(adapter, args.max_per_host)
+        results, elapsed = run(providers, secret, args.concurrent)
+        report(results, elapsed)
+        for key, count in sorted(adapter.recorded.items()):
+            print(f"Recorded {count} response(s) for {key}")
+        return
+
+    with ReplayServer(
+        args.fixtures, args.latency, args.jitter, args.error_rate, args.error_status, args.seed
+    ) as server:
+        print(f"Replaying {len(server.index)} fixture(s) from {server.base_url}")
+        use_session(ReplayAdapter(server.base_url, pool_maxsize=args.max_per_host), args.max_per_host)
+        results, elapsed = run(providers, secret, args.concurrent)
+    report(results, elapsed)
+    server.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 import argparse
 import re
 import sys
-import yaml
 from pathlib import Path
 from thefuzz import fuzz
 
+from fuzzy_index import FuzzyIndex
+from product_catalog import load_catalog
+from yaml_files import PendingWrites
+
 # Some terminals wrap pasted text in bracketed-paste markers (ESC[200~ ... ESC[201~);
 # input() does not strip them, so remove them to keep pasted product names usable.
 BRACKETED_PASTE_RE = re.compile(r"\x1b\[20[01]~")
@@ -45,6 +48,12 @@ parser.add_argument(
     help="Minimum gap between the best and second-best score required to "
          "auto-match, to avoid false friends (default: 8).",
 )
+parser.add_argument(
+    "--check-index",
+    action="store_true",
+    help="Check that the candidate index finds the same top matches as "
+         "scoring every known product, for every review entry.",
+)
 parser.add_argument(
     "--dry-run",
     action="store_true",
@@ -54,9 +63,13 @@ parser.add_argument(
 args = parser.parse_args()
 skip_patterns = [p.lower() for p in args.skip]
 
+# Every edit is kept in memory and each touched file is written once, when
+# the session ends (however it ends, including Ctrl-C or a SIGTERM/SIGHUP)
+pending = PendingWrites()
+pending.flush_at_exit()
+
 review_path = Path("data/review.yaml")
-with open(review_path) as review_file:
-    review_data = yaml.safe_load(review_file)
+review_data = pending.load(review_path)
 
 
 def remove_from_review(handled):
@@ -70,8 +83,7 @@ def remove_from_review(handled):
             del provider_products[name]
             removed = True
     if removed:
-        with open(review_path, "w") as review_file:
-            yaml.dump(review_data, review_file)
+        pending.save(review_path, review_data)
 
 
 def apply_identifier(handled, target_name, target_file):
@@ -79,92 +91,17 @@ def apply_identifier(handled, target_name, target_file):
     Returns (True, None) on success, or (False, existing) without writing when
     a different value is already set for one of the identifier keys (a conflict
     a human should resolve)."""
-    with open(target_file) as product_file:
-        import_products = yaml.safe_load(product_file)
-    identifiers = import_products["products"][target_name].setdefault("identifiers", {})
+    import_products = pending.load(target_file)
+    target = import_products["products"][target_name]
+    identifiers = target.get("identifiers", {})
     for key, value in handled[1].items():
         if key in identifiers and identifiers[key] != value:
             return False, identifiers[key]
-    identifiers.update(handled[1])
-    with open(target_file, "w") as product_file:
-        yaml.dump(import_products, product_file)
+    target.setdefault("identifiers", {}).update(handled[1])
+    pending.save(target_file, import_products)
     return True, None
 
 
-def run_auto():
-    """Auto-apply only high-confidence, unambiguous matches; anything below
-    the score/margin thresholds is left in review.yaml for the manual pass."""
-    matched = conflicts = ambiguous = 0
-    for handled in list(review_products):
-        # Drop [set code] tags and booster pack counts like "(36Packs)" for
-        # matching (mtgjson names lack them), but keep years, player names and
-        # "(N Starter Pack)" counts -- the count is the only thing telling a
-        # single starter/tournament pack apart from its display box.
-        query = re.sub(r"\[[^\]]*\]|\(\s*\d+\s*Packs?\s*\)", " ", handled[0], flags=re.I)
-        query = re.sub(r"\s+", " ", query).strip()
-
-        best_score = second_score = -1
-        best = None
-        for candidate in known_products:
-            score = fuzz.token_sort_ratio(query, candidate[0])
-            if score > best_score:
-                second_score = best_score
-                best_score, best = score, candidate
-            elif score > second_score:
-                second_score = score
-
-        margin = best_score - second_score
-        if best is None or best_score < args.auto_score or margin < args.auto_margin:
-            ambiguous += 1
-            continue
-
-        # Edition code of the matched product (its data/products/<CODE>.yaml file)
-        code = best[1].stem
-        identifier = "/".join(str(v) for v in handled[1].values())
-
-        if args.dry_run:
-            print(f"[{best_score}/{margin}] {handled[0]!r} ({identifier}) -> {best[0]!r} [{code}]")
-            matched += 1
-            continue
-
-        ok, _ = apply_identifier(handled, best[0], best[1])
-        if ok:
-            remove_from_review(handled)
-            matched += 1
-            print(f"matched [{best_score}/{margin}] {handled[0]!r} ({identifier}) -> {best[0]!r} [{code}]")
-        else:
-            conflicts += 1
-
-    print(
-        f"\nAuto-match: {matched} matched, {conflicts} conflicts, "
-        f"{ambiguous + conflicts} left for review"
-        + (" (dry run, nothing written)" if args.dry_run else "")
-    )
-
-review_products = []
-skipped_count = 0
-for provider_name, provider in review_data.items():
-    for name, contents in provider.items():
-        if any(p in name.lower() for p in skip_patterns):
-            skipped_count += 1
-            continue
-        review_products.append((name, contents["identifiers"], contents.get("release_date", False), provider_name))
-
-if skip_patterns:
-    print(f"Skipping {skipped_count} review entries matching: {args.skip}")
-
-known_products = []
-for contentfile in Path("data/products").glob("*.yaml"):
-    with open(contentfile, 'r') as known_file:
-        known_data = yaml.safe_load(known_file)
-    for product_name in known_data["products"].keys():
-        known_products.append((product_name, contentfile))
-
-if args.auto:
-    run_auto()
-    sys.exit(0)
-
-
 def infer_product_definition(product_name):
     category = "UNKNOWN"
     subtype = "UNKNOWN"
@@ -255,6 +192,121 @@ def infer_product_definition(product_name):
 
     return category, subtype
 
+
+def entry_blocks(name):
+    """Set codes tagged in a review entry's name, and the category it seems to be."""
+    return {
+        "set_codes": re.findall(r"\[([^\]]+)\]", name),
+        "category": infer_product_definition(name)[0],
+    }
+
+
+def auto_query(name):
+    # Drop [set code] tags and booster pack counts like "(36Packs)" for
+    # matching (mtgjson names lack them), but keep years, player names and
+    # "(N Starter Pack)" counts -- the count is the only thing telling a
+    # single starter/tournament pack apart from its display box.
+    query = re.sub(r"\[[^\]]*\]|\(\s*\d+\s*Packs?\s*\)", " ", name, flags=re.I)
+    return re.sub(r"\s+", " ", query).strip()
+
+
+def verify_index():
+    """Compare the candidate index's top matches, one by one and batched,
+    with scoring every known product, for every review entry."""
+    mismatches = 0
+    queries = [query for handled in review_products for query in (handled[0], auto_query(handled[0]))]
+    batched = fuzzy_index.top_batch(queries, 5)
+    for i, query in enumerate(queries):
+        brute = sorted(
+            ((fuzz.token_sort_ratio(query, p[0]), j) for j, p in enumerate(fuzzy_index.products)),
+            key=lambda item: (-item[0], item[1]),
+        )[:5]
+        expected = [(score, fuzzy_index.products[j]) for score, j in brute]
+        found = fuzzy_index.top(query, 5, **entry_blocks(review_products[i // 2][0]))
+        for method, result in (("index", found), ("batch", batched[i])):
+            if result != expected:
+                mismatches += 1
+                print(f"MISMATCH {query!r}: {method} {result[:1]} != brute force {expected[:1]}")
+    print(f"Checked {len(review_products)} review entries, {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+def run_auto():
+    """Auto-apply only high-confidence, unambiguous matches; anything below
+    the score/margin thresholds is left in review.yaml for the manual pass."""
+    # Products scoring less can't change whether an entry is matched, so the
+    # index doesn't need to score them
+    min_score = args.auto_score - args.auto_margin
+    matched = conflicts = ambiguous = 0
+    handled_products = list(review_products)
+    matches = fuzzy_index.top_batch(
+        [auto_query(handled[0]) for handled in handled_products], 2, min_score
+    )
+    for handled, ranked in zip(handled_products, matches):
+        best_score = second_score = -1
+        best = None
+        if ranked:
+            best_score, best = ranked[0]
+        if len(ranked) > 1:
+            second_score = ranked[1][0]
+
+        margin = best_score - second_score
+        # When nothing else reached min_score, only a lower bound is known
+        margin_text = str(margin) if len(ranked) > 1 else f">={best_score - min_score + 1}"
+        if best is None or best_score < args.auto_score or margin < args.auto_margin:
+            ambiguous += 1
+            continue
+
+        # Edition code of the matched product (its data/products/<CODE>.yaml file)
+        code = best[1].stem
+        identifier = "/".join(str(v) for v in handled[1].values())
+
+        if args.dry_run:
+            print(f"[{best_score}/{margin_text}] {handled[0]!r} ({identifier}) -> {best[0]!r} [{code}]")
+            matched += 1
+            continue
+
+        ok, _ = apply_identifier(handled, best[0], best[1])
+        if ok:
+            remove_from_review(handled)
+            matched += 1
+            print(f"matched [{best_score}/{margin_text}] {handled[0]!r} ({identifier}) -> {best[0]!r} [{code}]")
+        else:
+            conflicts += 1
+
+    print(
+        f"\nAuto-match: {matched} matched, {conflicts} conflicts, "
+        f"{ambiguous + conflicts} left for review"
+        + (" (dry run, nothing written)" if args.dry_run else "")
+    )
+
+review_products = []
+skipped_count = 0
+for provider_name, provider in review_data.items():
+    for name, contents in provider.items():
+        if any(p in name.lower() for p in skip_patterns):
+            skipped_count += 1
+            continue
+        review_products.append((name, contents["identifiers"], contents.get("release_date", False), provider_name))
+
+if skip_patterns:
+    print(f"Skipping {skipped_count} review entries matching: {args.skip}")
+
+fuzzy_index = FuzzyIndex()
+for product_name, contentfile, category in load_catalog():
+    fuzzy_index.add(product_name, contentfile, category)
+known_products = fuzzy_index.products
+
+if args.check_index:
+    verify_index()
+    sys.exit(0)
+
+if args.auto:
+    run_auto()
+    sys.exit(0)
+
+
 index = 0
 offset = 0
 while index < len(review_products):
@@ -262,9 +314,9 @@ while index < len(review_products):
     index += 1
 
     print(f"Finding similar products for {product[0]} {product[1]}")
-    known_products.sort(key=lambda x: fuzz.token_sort_ratio(x[0], product[0]), reverse=True)
-    for i in range(5):
-        name, code_path = known_products[i + offset]
+    ranked = [p for _, p in fuzzy_index.top(product[0], offset + 5, **entry_blocks(product[0]))]
+    for i in range(min(5, len(ranked) - offset)):
+        name, code_path, _ = ranked[i + offset]
         print(f"  {i} - [{code_path.stem}] {name}")
 
     try:
@@ -277,6 +329,7 @@ while index < len(review_products):
         if product_check.strip().lower() == known_products[i][0].lower():
             product_check = "0"
             offset = i
+            ranked = known_products
 
     # Default selection
     if product_check == "":
@@ -307,40 +360,35 @@ while index < len(review_products):
             index = 0
         offset = 0
     elif product_check == "i":
-        with open("data/ignore.yaml", "r") as ignore_file:
-            ignore_content = yaml.safe_load(ignore_file) or {}
+        ignore_content = pending.load("data/ignore.yaml") or {}
         # The review entry's provider name is the ignore.yaml section name
         section = ignore_content.setdefault(product[3], {})
         for identifier in product[1].values():
             section[identifier] = product[0]
-        with open("data/ignore.yaml", "w") as ignore_file:
-            yaml.dump(ignore_content, ignore_file)
+        pending.save("data/ignore.yaml", ignore_content)
         remove_from_review(product)
     elif product_check in ["0","1","2","3","4"]:
         check_index = int(product_check) + offset
-        if check_index >= len(known_products):
-            print(f"NOTE: Selection out of range, max index is {len(known_products) - 1}")
+        if check_index >= len(ranked):
+            print(f"NOTE: Selection out of range, max index is {len(ranked) - 1}")
             index -= 1
             continue
-        product_link = known_products[check_index]
-        with open(product_link[1], 'r') as product_file:
-            import_products = yaml.safe_load(product_file)
-        if "identifiers" not in import_products["products"][product_link[0]]:
-            import_products["products"][product_link[0]]["identifiers"] = {}
+        product_link = ranked[check_index]
+        import_products = pending.load(product_link[1])
+        existing = import_products["products"][product_link[0]].get("identifiers", {})
         keep = True
         for key in product[1].keys():
-            if key in import_products["products"][product_link[0]]["identifiers"] and import_products['products'][product_link[0]]['identifiers'][key] != product[1][key]:
+            if key in existing and existing[key] != product[1][key]:
                 try:
-                    ask = read_input(f"Confirm overwrite of existing id ({import_products['products'][product_link[0]]['identifiers'][key]})? [Y] ").lower()
+                    ask = read_input(f"Confirm overwrite of existing id ({existing[key]})? [Y] ").lower()
                     keep = ask == "y" or ask == ""
                 except EOFError:
                     sys.exit(1)
         if not keep:
             index -= 1
             continue
-        import_products["products"][product_link[0]]["identifiers"].update(product[1])
-        with open(product_link[1], 'w') as product_file:
-            yaml.dump(import_products, product_file)
+        import_products["products"][product_link[0]].setdefault("identifiers", {}).update(product[1])
+        pending.save(product_link[1], import_products)
         remove_from_review(product)
     elif product_check == "c":
         try:
@@ -354,7 +402,7 @@ while index < len(review_products):
 
         # Warn before creating a brand-new set: usually this means the code was
         # mistyped rather than that a genuinely new set is being introduced.
-        if not Path(f"data/products/{set_code}.yaml").exists():
+        if not pending.exists(f"data/products/{set_code}.yaml"):
             try:
                 confirm = read_input(
                     f"WARNING: no data/products/{set_code}.yaml exists yet -- this creates a NEW set code. Continue? [y/N] "
@@ -374,9 +422,8 @@ while index < len(review_products):
             sys.exit(1)
 
         target_path = Path(f"data/products/{set_code}.yaml")
-        if target_path.exists():
-            with open(target_path, "r") as f:
-                content = yaml.safe_load(f) or {}
+        if pending.exists(target_path):
+            content = pending.load(target_path) or {}
             if product_name in content["products"].keys():
                 print("Product already exists, not creating.")
                 index -= 1
@@ -392,15 +439,13 @@ while index < len(review_products):
             "subtype": subtype,
         }
 
-        with target_path.open("w") as product_file:
-            yaml.dump(content, product_file)
+        pending.save(target_path, content)
 
         # Mirror the new product into the contents file as an empty placeholder,
         # so it is tracked there too (its contents get filled in separately).
         contents_path = Path(f"data/contents/{set_code}.yaml")
-        if contents_path.exists():
-            with open(contents_path, "r") as f:
-                contents_data = yaml.safe_load(f) or {}
+        if pending.exists(contents_path):
+            contents_data = pending.load(contents_path) or {}
             contents_data.setdefault("code", set_code.lower())
             contents_data.setdefault("products", {})
         else:
@@ -408,11 +453,10 @@ while index < len(review_products):
 
         contents_data["products"].setdefault(product_name, {})
 
-        with contents_path.open("w") as contents_file:
-            yaml.dump(contents_data, contents_file)
+        pending.save(contents_path, contents_data)
 
         remove_from_review(product)
-        known_products.append((product_name, target_path))
+        fuzzy_index.add(product_name, target_path, category)
         print("Product added, don't forget to review and update default fields")
 
     else:
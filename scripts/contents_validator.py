@@ -1,7 +1,26 @@
-import yaml
-import product_classes as pc
+"""
+Validate data/contents and data/products, one file per worker process.
+
+Every problem is reported as a Diagnostic (file, product, rule, message);
+warnings are printed but only errors make the run fail. With --changed-since,
+only the files that differ from a git ref (committed, staged, unstaged or
+untracked) are checked, which is what a pre-commit hook wants:
+    python scripts/contents_validator.py --changed-since HEAD
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import product_classes as pc
+from yaml_files import load_yaml
+
+CONTENTS_DIR = Path("data/contents/")
+PRODUCTS_DIR = Path("data/products/")
+
 valid_categories = [
     "BOOSTER_PACK", "BOOSTER_BOX", "BOOSTER_CASE", "DECK", "MULTI_DECK",
     "DECK_BOX", "BOX_SET", "KIT", "BUNDLE", "BUNDLE_CASE",
@@ -19,58 +38,167 @@ valid_subtypes = [
     "SEALED_SET", "PRERELEASE", "OTHER", "CHALLENGER", "SIX", "CONVENTION", "MTGO_REDEMPTION",
 ]
 
-if __name__ == "__main__":
-    contentFolder = Path("data/contents/")
-    failed = False
-    for set_file in contentFolder.glob("*.yaml"):
-        with open(set_file, "rb") as f:
-            contents = yaml.safe_load(f)
-
-        for name, p in contents["products"].items():
-            if not p:
-                p = {}
-            if isinstance(p, list):
-                print(f"Product {name} in set {set_file.stem} formatted incorrectly")
-                failed = True
+
+class Diagnostic:
+    def __init__(self, file, product, rule, message, severity="error"):
+        self.file = file
+        self.product = product
+        self.rule = rule
+        self.message = message
+        self.severity = severity
+
+    def toJson(self):
+        return {
+            "file": self.file,
+            "product": self.product,
+            "rule": self.rule,
+            "message": self.message,
+            "severity": self.severity,
+        }
+
+    def __str__(self):
+        location = f"{self.file}: {self.product}" if self.product else self.file
+        return f"{location}: {self.severity} [{self.rule}] {self.message}"
+
+
+def load_products(set_file):
+    """The file's data and its products, or a diagnostic when it can't be read."""
+    try:
+        contents = load_yaml(set_file.read_bytes())
+        return contents, contents["products"], None
+    except Exception as e:
+        return None, None, Diagnostic(str(set_file), None, "yaml", f"Unreadable: {type(e).__name__}: {' '.join(str(e).split())}")
+
+
+def validate_contents_file(set_file):
+    contents, products, diagnostic = load_products(set_file)
+    if diagnostic:
+        return [diagnostic]
+
+    diagnostics = []
+    for name, p in products.items():
+        if not p:
+            p = {}
+        if isinstance(p, list):
+            diagnostics.append(Diagnostic(
+                str(set_file), name, "format", f"Product {name} in set {set_file.stem} formatted incorrectly"
+            ))
+            continue
+        if set(p.keys()) == {"copy"}:
+            if p["copy"] not in products:
+                diagnostics.append(Diagnostic(
+                    str(set_file), name, "copy", f"Product {name} copies unknown product {p['copy']}"
+                ))
                 continue
-            if set(p.keys()) == {"copy"}:
-                p = contents["products"][p["copy"]]
-            try:
-                pc.product(p, contents["code"], name)
-            except:
-                print(f"Product {name} in set {set_file.stem} failed")
-                failed = True
-    if failed:
-        raise ImportError()
-
-    productsFolder = Path("data/products/")
-    failed = False
-    all_files = sorted(list(productsFolder.glob("*.yaml")))
-    for set_file in all_files:
-        with open(set_file, "rb") as f:
-            contents = yaml.safe_load(f)
-        
-        for name, p in contents["products"].items():
-            if "category" not in p.keys():
-                print(f"Product {name} in set {set_file.stem} missing category")
-                failed = True
-            elif p['category'] not in valid_categories:
-                if p['category'] == "UNKNOWN":
-                    print(f"Product {name} missing a valid category")
-                    #pass
-                else:
-                    print(f"Product {name} has an invalid category: {p['category']}")
-                    failed = True
-            if "subtype" not in p.keys():
-                print(f"Product {name} in set {set_file.stem} missing subtype")
-                failed = True
-            elif p['subtype'] not in valid_subtypes:
-                if p['subtype'] == "UNKNOWN":
-                    print(f"Product {name} missing a valid subtype")
-                    #pass
-                else:
-                    print(f"Product {name} uses an invalid subtype: {p['subtype']}")
-                    failed = True
-    if failed:
-        raise ImportError()
-    print("All products validated")
+            p = products[p["copy"]]
+        try:
+            pc.product(p, contents["code"], name)
+        except Exception as e:
+            diagnostics.append(Diagnostic(
+                str(set_file), name, "product",
+                f"Product {name} in set {set_file.stem} failed: {type(e).__name__}: {e}",
+            ))
+    return diagnostics
+
+
+def validate_field(set_file, name, p, field, valid_values, article):
+    if field not in p.keys():
+        return Diagnostic(str(set_file), name, f"{field}-missing", f"Product {name} in set {set_file.stem} missing {field}")
+    if p[field] in valid_values:
+        return None
+    if p[field] == "UNKNOWN":
+        return Diagnostic(str(set_file), name, f"{field}-unknown", f"Product {name} missing a valid {field}", "warning")
+    return Diagnostic(str(set_file), name, f"{field}-invalid", f"Product {name} {article} an invalid {field}: {p[field]}")
+
+
+def validate_products_file(set_file):
+    _, products, diagnostic = load_products(set_file)
+    if diagnostic:
+        return [diagnostic]
+
+    diagnostics = []
+    for name, p in products.items():
+        if not isinstance(p, dict):
+            diagnostics.append(Diagnostic(
+                str(set_file), name, "format", f"Product {name} in set {set_file.stem} formatted incorrectly"
+            ))
+            continue
+        for field, valid_values, article in (
+            ("category", valid_categories, "has"),
+            ("subtype", valid_subtypes, "uses"),
+        ):
+            diagnostic = validate_field(set_file, name, p, field, valid_values, article)
+            if diagnostic:
+                diagnostics.append(diagnostic)
+    return diagnostics
+
+
+def validate_file(set_file):
+    folder = set_file.resolve().parent
+    if folder == CONTENTS_DIR.resolve():
+        return validate_contents_file(set_file)
+    if folder == PRODUCTS_DIR.resolve():
+        return validate_products_file(set_file)
+    return [Diagnostic(
+        str(set_file), None, "location", f"Not in {CONTENTS_DIR} or {PRODUCTS_DIR}, no rules to check it against"
+    )]
+
+
+def changed_files(ref):
+    """The data files that differ from `ref`, or were added since."""
+    folders = [str(CONTENTS_DIR), str(PRODUCTS_DIR)]
+    changed = subprocess.run(
+        ["git", "diff", "--name-only", "--diff-filter=d", ref, "--", *folders],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    untracked = subprocess.run(
+        ["git", "ls-files", "--others", "--exclude-standard", "--", *folders],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return sorted({Path(path) for path in changed + untracked if path.endswith(".yaml")})
+
+
+def validate(files, jobs=None):
+    if len(files) < 2 or jobs == 1:
+        results = map(validate_file, files)
+        return [diagnostic for diagnostics in results for diagnostic in diagnostics]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(validate_file, files, chunksize=8)
+        return [diagnostic for diagnostics in results for diagnostic in diagnostics]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the contents and products YAML files.")
+    parser.add_argument("files", nargs="*", type=Path, help="Files to check (default: all of them)")
+    parser.add_argument("--changed-since", metavar="REF", help="Only check the files changed since this git ref")
+    parser.add_argument("--jobs", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--json", action="store_true", help="Print the diagnostics as JSON lines")
+    args = parser.parse_args()
+
+    if args.files:
+        files = args.files
+    elif args.changed_since:
+        try:
+            files = changed_files(args.changed_since)
+        except subprocess.CalledProcessError as e:
+            print(f"Could not list the files changed since {args.changed_since}: {e.stderr.strip()}", file=sys.stderr)
+            sys.exit(2)
+    else:
+        files = sorted(CONTENTS_DIR.glob("*.yaml")) + sorted(PRODUCTS_DIR.glob("*.yaml"))
+
+    diagnostics = validate(files, args.jobs)
+    for diagnostic in diagnostics:
+        print(json.dumps(diagnostic.toJson()) if args.json else diagnostic)
+
+    errors = sum(diagnostic.severity == "error" for diagnostic in diagnostics)
+    warnings = len(diagnostics) - errors
+    summary = f"{len(files)} file(s) checked: {errors} error(s), {warnings} warning(s)"
+    if errors:
+        print(f"Validation failed, {summary}", file=sys.stderr)
+        sys.exit(1)
+    print(f"All products validated, {summary}")
+
+
+if __name__ == "__main__":
+    main()
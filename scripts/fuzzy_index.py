@@ -0,0 +1,205 @@
+"""
+Candidate index for fuzzy matching review entries against known products.
+
+Scoring every known product with fuzz.token_sort_ratio for every review
+entry is quadratic. FuzzyIndex keeps a trigram inverted index over the
+normalized names (lowercased, sorted tokens, as token_sort_ratio compares
+them) so that a query is only scored exactly against:
+
+  - its shortlist: the products of the set codes it names and the products
+    sharing the most trigrams with it, products of its category first
+  - then any other product whose upper bound, derived from its length and
+    the trigrams it shares with the query, could still reach the results
+
+By the q-gram lemma, two strings within Levenshtein distance k share at
+least max(len) - 2 - 3k trigrams, and the Indel distance token_sort_ratio
+is based on is at least the Levenshtein distance, so a product whose bound
+falls short can't make it. The results are the same as scoring everything.
+"""
+
+import heapq
+import math
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from thefuzz import fuzz, utils
+
+try:
+    # Scores whole batches of queries in native code, on every core
+    import numpy
+    from rapidfuzz import fuzz as rapidfuzz_fuzz, process
+except ImportError:
+    process = None
+
+# Products scored up front, before the upper bounds take over
+SHORTLIST_SIZE = 32
+
+# Queries scored per score matrix, to bound its memory
+BATCH_SIZE = 512
+
+
+def normalize(name: str) -> str:
+    return " ".join(sorted(utils.full_process(name, force_ascii=True).split()))
+
+
+def trigrams(text: str) -> List[Tuple[str, int]]:
+    """Every trigram of `text` with its occurrence number, so that counting
+    the ones two texts have in common counts repeated trigrams properly."""
+    seen = Counter()
+    grams = []
+    for i in range(len(text) - 2):
+        gram = text[i:i + 3]
+        seen[gram] += 1
+        grams.append((gram, seen[gram]))
+    return grams
+
+
+def upper_bound(query_length: int, length: int, shared: int) -> float:
+    """Highest token_sort_ratio two normalized names of these lengths and
+    sharing this many trigrams can score."""
+    total = query_length + length
+    if not total:
+        return 100
+    min_edits = math.ceil(max(0, max(query_length, length) - 2 - shared) / 3)
+    min_distance = max(abs(query_length - length), min_edits)
+    return 100 * (1 - min_distance / total)
+
+
+class FuzzyIndex:
+    def __init__(self) -> None:
+        # (name, set file, category) by position
+        self.products: List[tuple] = []
+        self.__normalized: List[str] = []
+        self.__postings = defaultdict(list)
+        self.__by_length = defaultdict(list)
+        self.__by_set = defaultdict(list)
+        self.__by_category = defaultdict(set)
+
+    def add(self, name: str, set_file, category: Optional[str] = None) -> None:
+        position = len(self.products)
+        normalized = normalize(name)
+        self.products.append((name, set_file, category))
+        self.__normalized.append(normalized)
+        for gram in trigrams(normalized):
+            self.__postings[gram].append(position)
+        self.__by_length[len(normalized)].append(position)
+        self.__by_set[set_file.stem.lower()].append(position)
+        if category:
+            self.__by_category[category].add(position)
+
+    def top(
+        self,
+        query: str,
+        n: int,
+        set_codes: Iterable[str] = (),
+        category: Optional[str] = None,
+        min_score: int = 0,
+    ) -> List[Tuple[int, tuple]]:
+        """
+        The n best (score, product) for `query`, best first, ties in the
+        order products were added: exactly what sorting every product by
+        fuzz.token_sort_ratio would give.
+
+        :param set_codes: Set codes named in the entry, whose products are shortlisted
+        :param category: Category the entry seems to be, shortlisted first
+        :param min_score: Products scoring less are left out, which saves
+            scoring most of them when it is high
+        """
+        normalized = normalize(query)
+        query_length = len(normalized)
+
+        shared = Counter()
+        for gram in trigrams(normalized):
+            shared.update(self.__postings.get(gram, ()))
+
+        scores = {}
+        # The n best scores so far, lowest first
+        best = []
+
+        def score(position):
+            if position in scores:
+                return
+            # token_sort_ratio, without normalizing the product's name again
+            value = fuzz.ratio(normalized, self.__normalized[position])
+            scores[position] = value
+            if len(best) < n:
+                heapq.heappush(best, value)
+            elif value > best[0]:
+                heapq.heapreplace(best, value)
+
+        def threshold():
+            # Anything that can't round up to the n-th best score so far (a
+            # tie still counts, for the order) is out
+            return max(best[0] if len(best) == n else 0, min_score) - 0.5
+
+        for code in set_codes:
+            for position in self.__by_set.get(code.lower(), ()):
+                score(position)
+        in_category = self.__by_category.get(category, set())
+        for position, _ in sorted(
+            shared.most_common(SHORTLIST_SIZE * 2),
+            key=lambda item: (-item[1], item[0] not in in_category),
+        )[:SHORTLIST_SIZE]:
+            score(position)
+
+        # Then the products of lengths that can still make it, most promising
+        # first. Sharing every trigram of the query gives a length's loosest
+        # bound, so whole lengths are ruled out before looking at products.
+        lengths = [
+            length
+            for length in self.__by_length
+            if upper_bound(query_length, length, query_length) >= threshold()
+        ]
+        bounds = sorted(
+            (
+                (upper_bound(query_length, length, shared.get(position, 0)), position)
+                for length in lengths
+                for position in self.__by_length[length]
+                if position not in scores
+            ),
+            reverse=True,
+        )
+        for bound, position in bounds:
+            if bound < threshold():
+                break
+            score(position)
+
+        ranked = sorted(
+            (item for item in scores.items() if item[1] >= min_score),
+            key=lambda item: (-item[1], item[0]),
+        )[:n]
+        return [(value, self.products[position]) for position, value in ranked]
+
+    def top_batch(
+        self, queries: List[str], n: int, min_score: int = 0
+    ) -> List[List[Tuple[int, tuple]]]:
+        """
+        top() for many queries at once. With rapidfuzz and numpy installed,
+        the queries x products score matrix is computed in bulk by
+        rapidfuzz's cdist on all cores; otherwise each query goes through
+        top(). Either way the results are the same as top()'s.
+        """
+        if process is None:
+            return [self.top(query, n, min_score=min_score) for query in queries]
+
+        results = []
+        for start in range(0, len(queries), BATCH_SIZE):
+            scores = process.cdist(
+                [normalize(query) for query in queries[start:start + BATCH_SIZE]],
+                self.__normalized,
+                scorer=rapidfuzz_fuzz.ratio,
+                dtype=numpy.float64,
+                workers=-1,
+                # Scores rounding up to min_score still count
+                score_cutoff=max(min_score - 0.5, 0),
+            )
+            # Rounded as thefuzz does, then best first with ties in product order
+            scores = numpy.round(scores)
+            order = numpy.argsort(-scores, axis=1, kind="stable")[:, :n]
+            for row, positions in zip(scores, order):
+                results.append([
+                    (int(row[position]), self.products[position])
+                    for position in positions
+                    if row[position] >= min_score
+                ])
+        return results
@@ -1,49 +1,101 @@
-from typing import List, Optional
-import bs4
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import argparse
+import asyncio
 import datetime
+import hashlib
+import heapq
+import itertools
 import json
+import os
 import re
 import html
-import multiprocessing
 import pathlib
 import random
-import requests_cache
+import shutil
+import threading
+import time
+import zlib
+
+import ijson
+import requests
+import requests.adapters
+
+from gatherer_text import clean_original_text, clean_original_type
+from html_parsing import only, parse_html
+from replay_server import RecordingAdapter, ReplayAdapter, ReplayServer, Uncached
+from response_cache import ResponseCache
+from retryable_session import retryable_session
+
+# Set listings are only read for their links
+LINK_NODES = only(("a", {}))
+
+# Requests in flight at once, across every set
+CONCURRENCY = 8
+
+# Seconds between two requests sent to Gatherer, whatever their worker
+POLITENESS_DELAY = 0.1
+
+# What was crawled last, per set, and the overrides applied; kept in outputs/
+# next to the mapping it was built with, so that the scheduled run keeps it
+GATHERER_STATE_PATH = pathlib.Path("outputs/gatherer_sets_state.json")
+
+# How long a set whose card listing didn't change goes without being crawled
+# again, as Gatherer may still fix the text of its cards
+REFRESH_INTERVAL = datetime.timedelta(days=56)
+
+# Recorded with --record, replayed with --offline, under <fixtures>/gatherer/
+FIXTURES_DIR = pathlib.Path("fixtures")
+
+
+class PoliteAdapter(requests.adapters.BaseAdapter):
+    """
+    Transport adapter spacing the requests sent through `adapter` at least
+    `delay` seconds apart. Only requests that reach the network go through
+    an adapter, so cache hits are never held back.
+    """
+
+    def __init__(self, adapter: requests.adapters.BaseAdapter, delay: float) -> None:
+        super().__init__()
+        self.adapter = adapter
+        self.delay = delay
+        self.sent = 0
+        self.__lock = threading.Lock()
+        self.__next_send = 0.0
+
+    def send(self, request, **kwargs):
+        with self.__lock:
+            now = time.monotonic()
+            wait = self.__next_send - now
+            self.__next_send = max(now, self.__next_send) + self.delay
+            self.sent += 1
+        if wait > 0:
+            time.sleep(wait)
+        return self.adapter.send(request, **kwargs)
+
+    def close(self) -> None:
+        self.adapter.close()
 
 
 class GathererDownloader:
-    session: requests_cache.CachedSession
-    original_text_regex: re.Pattern
-    original_type_regex: re.Pattern
+    session: ResponseCache
+    original_details_regex: re.Pattern
     multiverse_id_text_regex: re.Pattern
-    split_card_regex: re.Pattern
-    old_school_mana_regex: re.Pattern
-    adventure_omen_text_regex: re.Pattern
-    fuse_and_doors_regex: re.Pattern
 
-    def __init__(self, session: requests_cache.CachedSession) -> None:
+    def __init__(self, session: ResponseCache) -> None:
         self.session = session
 
         version = random.randint(100, 150)
-        self.session.headers.update(
+        self.session.session.headers.update(
             {
                 "User-Agent": f"Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:{version}.0) Gecko/20100101 Firefox/{version}.0"
             }
         )
 
         # The original printed text/type are stored in a <script> tag, and we need to parse them out
-        self.original_text_regex = re.compile(r"\"instanceText\":\"(.*?)\",")
-        self.original_type_regex = re.compile(r"\"instanceTypeLine\":\"(.*?)\",")
+        self.original_details_regex = re.compile(r"\"(instanceText|instanceTypeLine)\":\"(.*?)\",")
         # We need to know the multiverse ID of the card, and again we need to <script> tag search it
         self.multiverse_id_text_regex = re.compile(r'\\"multiverseId\\":([0-9]+)')
-        self.split_card_regex = re.compile(r"(.*?)\n?///?\n(?:.*?\n){3}(.*)", re.DOTALL)
-        # Mana symbols on older cards are wonky and not in the {0} etc. format we expect
-        self.old_school_mana_regex = re.compile(r"o?o([0-9]+|[WUBRGX])")
-        self.adventure_omen_text_regex = re.compile(
-            r"(.*?)\n?//(?:ADV|OMEN)//\n(?:.*?\n){3}(.*)", re.DOTALL
-        )
-        self.fuse_and_doors_regex = re.compile(
-            r"(.*?)\n?///?\n(?:.*?\n){2}(.*)//\n?(.*)", re.DOTALL
-        )
 
     def __del__(self) -> None:
         self.session.close()
@@ -57,7 +109,7 @@ class GathererDownloader:
             formatted_url = url.format(page_number)
             paged_response = self.session.get(formatted_url)
 
-            soup = bs4.BeautifulSoup(paged_response.text, "html.parser")
+            soup = parse_html(paged_response.text, LINK_NODES)
 
             at_least_one_set_found = False
             for a_tag in soup.find_all("a"):
@@ -80,7 +132,7 @@ class GathererDownloader:
             formatted_url = url.format(set_code, page_number)
             paged_response = self.session.get(formatted_url)
 
-            soup = bs4.BeautifulSoup(paged_response.content, "html.parser")
+            soup = parse_html(paged_response.content, LINK_NODES)
 
             at_least_one_card_found = False
             for a_tag in soup.find_all("a"):
@@ -94,197 +146,501 @@ class GathererDownloader:
 
         return card_urls
 
-    def get_card_multiverse_id(self, card_url: str) -> Optional[int]:
-        card_data_response = self.session.get(card_url).content.decode("utf-8")
-        multiverse_ids = self.multiverse_id_text_regex.findall(card_data_response)
-        if multiverse_ids:
-            return int(multiverse_ids[0])
+    def get_card_details(self, card_url: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        """
+        The multiverse ID of the card and its original printed text and type,
+        from a single fetch of its page, or None when it has no multiverse ID.
+        """
+        content = self.session.get(card_url).content
+        match = self.multiverse_id_text_regex.search(content.decode("utf-8"))
+        multiverse_id = int(match.group(1)) if match else 0
+        if not multiverse_id:
+            print(f"No multiverse ID found for {card_url}")
+            return None
+
+        # The first text and type line, in a single pass over the page
+        details = {}
+        for match in self.original_details_regex.finditer(self._decode_card_response(content)):
+            details.setdefault(match.group(1), match.group(2))
+            if len(details) == 2:
+                break
 
-        print(f"No multiverse ID found for {card_url}")
-        return 0
+        return multiverse_id, {
+            "text": clean_original_text(details.get("instanceText", "")),
+            "type": clean_original_type(details.get("instanceTypeLine", "")),
+        }
 
-    def _get_decoded_card_response(self, card_url: str) -> str:
+    @staticmethod
+    def _decode_card_response(content: bytes) -> str:
         return html.unescape(
-            self.session.get(card_url)
-            .content.decode("unicode_escape")
+            content.decode("unicode_escape")
             .replace("\u2028", "")  # Exception case for WWK #4 - Battle Hurda
             .encode("latin1")
             .decode("utf-8")
         )
 
-    def get_card_original_printed_text(self, card_url: str) -> Optional[str]:
-        card_data_response = self._get_decoded_card_response(card_url)
-
-        original_texts = self.original_text_regex.findall(card_data_response)
-        if not original_texts:
-            return ""
-
-        text = original_texts[0]
-        functions = [
-            self.__strip_slashes,
-            self.__strip_adventure_or_omen_component,
-            self.__strip_fuse_and_doors,
-            self.__strip_class_levels,
-            self.__strip_split_component,
-            self.__fix_old_school_mana,
-            self.__strip_html,
-        ]
-        for func in functions:
-            text = func(text)
-        return text
-
-    def get_card_original_printed_type(self, card_url: str) -> Optional[str]:
-        card_data_response = self._get_decoded_card_response(card_url)
-
-        original_types = self.original_type_regex.findall(card_data_response)
-        if not original_types:
-            return ""
-
-        type_line = original_types[0]
-        type_line = self.__strip_slashes(type_line)
-        type_line = self.__strip_html(type_line)
-        return type_line
 
-    @staticmethod
-    def __strip_slashes(card_text: str) -> str:
-        return card_text.replace("\\n", "\n").replace('\\"', '"')
+def gatherer_cache(session: Optional[requests.Session] = None) -> ResponseCache:
+    # Every set shares one store; the budget is sized for a full crawl
+    return ResponseCache(
+        "gatherer",
+        session=session,
+        expire_after=datetime.timedelta(days=100),
+        max_size=8 * 1024**3,
+    )
 
-    def __strip_adventure_or_omen_component(self, card_text: str) -> str:
-        if "//ADV//" not in card_text and "//OMEN//" not in card_text:
-            return card_text
 
-        texts = self.adventure_omen_text_regex.findall(card_text)
-        if texts and len(texts[0]) == 2:
-            return f"{texts[0][1]} // {texts[0][0]}"
+def crawler_session(
+    delay: float,
+    concurrency: int = CONCURRENCY,
+    adapter: Optional[requests.adapters.HTTPAdapter] = None,
+) -> Tuple[requests.Session, PoliteAdapter]:
+    """
+    One session for the whole crawl, keeping up to `concurrency` connections
+    alive, its requests spaced by `delay` and sent through `adapter` (to
+    record or replay them) when given.
+    """
+    session = retryable_session(pool_maxsize=concurrency)
+    if adapter is None:
+        adapter = session.get_adapter("https://")
+    else:
+        # Keep the session's retry policy on the replacing adapter
+        adapter.max_retries = session.get_adapter("https://").max_retries
+    polite = PoliteAdapter(adapter, delay)
+    session.mount("http://", polite)
+    session.mount("https://", polite)
+    return session, polite
+
+
+def write_dump(set_code: str, multiverse_id_to_printed_details_mapping: Dict[int, Dict[str, str]]) -> None:
+    with pathlib.Path(f"dumps/{set_code}.json").open("w") as dump_file:
+        json.dump(
+            multiverse_id_to_printed_details_mapping,
+            dump_file,
+            indent=4,
+            sort_keys=True,
+            ensure_ascii=False,
+        )
 
-        return card_text
 
-    def __strip_fuse_and_doors(self, card_text: str) -> str:
-        if "door" not in card_text and "Fuse" not in card_text:
-            return card_text
+def iter_dump(set_code: str) -> Iterator[Tuple[int, List[Dict[str, str]]]]:
+    """The mapping entries of a set's dump, in multiverse ID order (as
+    write_dump sorts them)."""
+    with pathlib.Path(f"dumps/{set_code}.json").open("rb") as dump_file:
+        for key, value in ijson.kvitems(dump_file, ""):
+            text = value.get("text", "") if isinstance(value, dict) else value
+            type_line = value.get("type", "") if isinstance(value, dict) else ""
+            entry = mapping_entry(text, type_line)
+            if entry:
+                yield int(key), entry
 
-        texts = self.fuse_and_doors_regex.findall(card_text)
-        if texts and len(texts[0]) == 3:
-            return f"{texts[0][0]} // {texts[0][1]}{texts[0][2]}"
 
-        return card_text
+def digest(value: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
 
-    @staticmethod
-    def __strip_class_levels(card_text: str) -> str:
-        if "Level_" not in card_text:
-            return card_text
 
-        return re.sub(r"//Level_[0-9]+//\n", "", card_text)
+def refresh_due(set_code: str, set_state: Dict[str, Any]) -> bool:
+    # Each set gets its own interval, between one and two REFRESH_INTERVALs,
+    # so that the sets of a full crawl don't all come due in the same run
+    spread = zlib.crc32(set_code.encode("utf-8")) / 2**32
+    age = time.time() - set_state["crawled_at"]
+    return age > REFRESH_INTERVAL.total_seconds() * (1 + spread)
 
-    def __strip_split_component(self, card_text: str) -> str:
-        if "//" not in card_text:
-            return card_text
 
-        split_texts = self.split_card_regex.findall(card_text)
-        if split_texts and len(split_texts[0]) == 2:
-            return f"{split_texts[0][0]} // {split_texts[0][1]}"
+def load_state() -> Dict[str, Any]:
+    if not GATHERER_STATE_PATH.exists():
+        return {}
+    with GATHERER_STATE_PATH.open("r") as fp:
+        return json.load(fp)
 
-        return card_text
 
-    def __fix_old_school_mana(self, card_text: str) -> str:
-        return self.old_school_mana_regex.sub(r"{\1}", card_text)
+def save_state(state: Dict[str, Any]) -> None:
+    with GATHERER_STATE_PATH.open("w") as fp:
+        json.dump(state, fp, sort_keys=True)
 
-    @staticmethod
-    def __strip_html(card_text: str) -> str:
-        if "<" not in card_text:
-            return card_text
 
-        return bs4.BeautifulSoup(card_text, "html.parser").get_text()
+def load_overrides() -> Dict[str, str]:
+    with pathlib.Path("data/gatherer_multiverse_id_overrides.json").open(
+        "r", encoding="utf-8"
+    ) as fp:
+        return json.load(fp)
 
 
-def download_set(set_code: str) -> None:
-    print("Downloading {0}".format(set_code))
-    cached_session = requests_cache.CachedSession(
-        cache_name=f"caches/gatherer_cache_{set_code}",
-        expire_after=datetime.timedelta(days=100),
-    )
-    downloader = GathererDownloader(cached_session)
-
-    multiverse_id_to_printed_details_mapping = dict()
-
-    card_urls = downloader.get_card_urls_from_set_code(set_code)
-    for card_url in card_urls:
-        multiverse_id = downloader.get_card_multiverse_id(card_url)
-        if multiverse_id:
-            original_printed_text = downloader.get_card_original_printed_text(card_url)
-            original_printed_type = downloader.get_card_original_printed_type(card_url)
-            multiverse_id_to_printed_details_mapping[multiverse_id] = {
-                "text": original_printed_text,
-                "type": original_printed_type,
-            }
+def shard_paths(directory: pathlib.Path) -> List[pathlib.Path]:
+    # Shards are named after the range of IDs they hold
+    return sorted(directory.glob("*.json"), key=lambda path: int(path.stem.split("-")[0]))
 
-    with pathlib.Path(f"dumps/{set_code}.json").open("w") as dump_file:
-        json.dump(
-            multiverse_id_to_printed_details_mapping,
-            dump_file,
-            indent=4,
-            sort_keys=True,
-            ensure_ascii=False,
-        )
 
+def iter_mapping(mapping_path: pathlib.Path) -> Iterator[Tuple[int, List[Dict[str, str]]]]:
+    """The entries of a mapping written by write_mapping, in multiverse ID
+    order, whether it is one file or a directory of shards."""
+    paths = shard_paths(mapping_path) if mapping_path.is_dir() else [mapping_path]
+    for path in paths:
+        with path.open("rb") as fp:
+            for key, value in ijson.kvitems(fp, ""):
+                yield int(key), value
 
-def get_set_codes():
-    cached_session = requests_cache.CachedSession(
-        cache_name=f"caches/gatherer_cache_main",
-        expire_after=datetime.timedelta(days=100),
-    )
+
+def mapping_readable(mapping_path: pathlib.Path) -> bool:
+    try:
+        next(iter_mapping(mapping_path), None)
+    except (OSError, ijson.JSONError):
+        # Missing, or not fetched from LFS
+        return False
+    return True
+
+
+def write_json_object(
+    path: pathlib.Path, items: Iterable[Tuple[int, List[Dict[str, str]]]], compact: bool
+) -> int:
+    """
+    Write `items` as one JSON object, an entry at a time. Indented, the file
+    is exactly what json.dump(..., indent=4, sort_keys=True) gives for the
+    same (sorted) items.
+    """
+    count = 0
+    with path.open("w", encoding="utf-8") as fp:
+        fp.write("{")
+        for key, value in items:
+            if compact:
+                fp.write("," if count else "")
+                fp.write(json.dumps({str(key): value}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))[1:-1])
+            else:
+                fp.write(",\n" if count else "\n")
+                fp.write(json.dumps({str(key): value}, indent=4, ensure_ascii=False, sort_keys=True)[2:-2])
+            count += 1
+        fp.write("\n}" if count and not compact else "}")
+    return count
+
+
+def write_mapping(
+    items: Iterable[Tuple[int, List[Dict[str, str]]]],
+    mapping_path: pathlib.Path,
+    compact: bool = False,
+    shard_size: Optional[int] = None,
+) -> int:
+    """
+    Write the mapping to `mapping_path` from `items` sorted by multiverse ID,
+    which may be read from the mapping being replaced: everything goes to a
+    temporary file (or directory) swapped in at the end.
+
+    :param compact: Leave out the indentation
+    :param shard_size: Write a directory of files holding this many IDs
+        each, e.g. 0-99999.json, instead of one file
+    """
+    temp_path = mapping_path.with_name(f"{mapping_path.name}.tmp")
+    if not shard_size:
+        count = write_json_object(temp_path, items, compact)
+        os.replace(temp_path, mapping_path)
+        return count
+
+    shutil.rmtree(temp_path, ignore_errors=True)
+    temp_path.mkdir(parents=True)
+    count = 0
+    for start, shard in itertools.groupby(items, key=lambda item: item[0] // shard_size * shard_size):
+        count += write_json_object(temp_path.joinpath(f"{start}-{start + shard_size - 1}.json"), shard, compact)
+    shutil.rmtree(mapping_path, ignore_errors=True)
+    temp_path.rename(mapping_path)
+    return count
+
+
+class GathererCrawler:
+    """
+    Crawls every set at once on an event loop. The downloader's blocking
+    calls run on a pool of CONCURRENCY threads sharing its session and
+    cache, and a semaphore bounds how many are in flight across all sets,
+    so the politeness delay rather than per-set sequential fetching limits
+    the throughput.
+
+    The card pages of a set are only crawled when the set is new, its card
+    listing changed since the last crawl recorded in `sets_state`, its last
+    crawl is due for a refresh, or it is in `forced`.
+    """
+
+    downloader: GathererDownloader
+    sets_state: Dict[str, Dict[str, Any]]
+    forced: Set[str]
+    listed: Set[str]
+    crawled: Dict[str, Dict[str, Any]]
+    cards: int
+    __slots: asyncio.Semaphore
+    __executor: ThreadPoolExecutor
+
+    def __init__(
+        self,
+        downloader: GathererDownloader,
+        concurrency: int = CONCURRENCY,
+        sets_state: Optional[Dict[str, Dict[str, Any]]] = None,
+        forced: Iterable[str] = (),
+    ) -> None:
+        self.downloader = downloader
+        self.sets_state = sets_state or {}
+        self.forced = set(forced)
+        # Every set seen, and the new state of those crawled
+        self.listed = set()
+        self.crawled = {}
+        self.cards = 0
+        self.__slots = asyncio.Semaphore(concurrency)
+        self.__executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def close(self) -> None:
+        self.__executor.shutdown()
+
+    async def __call(self, func, *args):
+        async with self.__slots:
+            return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+    async def get_set_codes(self) -> List[str]:
+        return sorted(await self.__call(self.downloader.get_set_codes))
+
+    async def download_set(self, set_code: str, force: bool = False) -> None:
+        self.listed.add(set_code)
+
+        # Listing pages are read in order, until the first empty one
+        card_urls = await self.__call(self.downloader.get_card_urls_from_set_code, set_code)
+        listing_hash = digest(sorted(card_urls))
+
+        previous = self.sets_state.get(set_code)
+        if (
+            previous
+            and not force
+            and set_code not in self.forced
+            and previous["listing_hash"] == listing_hash
+            and not refresh_due(set_code, previous)
+        ):
+            return
+
+        print("Downloading {0}".format(set_code))
+        cards = await asyncio.gather(
+            *(self.__call(self.downloader.get_card_details, card_url) for card_url in card_urls)
+        )
+
+        multiverse_id_to_printed_details_mapping = dict(card for card in cards if card)
+        self.cards += len(multiverse_id_to_printed_details_mapping)
+        write_dump(set_code, multiverse_id_to_printed_details_mapping)
+        self.crawled[set_code] = {
+            "crawled_at": time.time(),
+            "card_count": len(card_urls),
+            "listing_hash": listing_hash,
+            # Of the dump as written, so before any override
+            "content_hash": digest({str(key): value for key, value in multiverse_id_to_printed_details_mapping.items()}),
+            "multiverse_ids": sorted(multiverse_id_to_printed_details_mapping),
+        }
+
+    async def crawl(self, set_codes: Optional[List[str]] = None) -> None:
+        """Crawl `set_codes`, unconditionally, or every set Gatherer lists."""
+        if set_codes:
+            await asyncio.gather(*(self.download_set(set_code, force=True) for set_code in set_codes))
+        else:
+            set_codes = await self.get_set_codes()
+            await asyncio.gather(*(self.download_set(set_code) for set_code in set_codes))
+
+
+async def crawl(
+    downloader: GathererDownloader,
+    set_codes: Optional[List[str]],
+    concurrency: int,
+    sets_state: Dict[str, Dict[str, Any]],
+    forced: Iterable[str],
+) -> GathererCrawler:
+    crawler = GathererCrawler(downloader, concurrency, sets_state, forced)
     try:
-        downloader = GathererDownloader(cached_session)
-        return sorted(downloader.get_set_codes())
+        await crawler.crawl(set_codes)
     finally:
-        cached_session.close()
+        crawler.close()
+    return crawler
+
+
+def mapping_entry(text: str, type_line: str) -> Optional[List[Dict[str, str]]]:
+    if not (text or type_line):
+        return None
+    entry = {"original_text": text}
+    if type_line:
+        entry["original_type"] = type_line
+    return [entry]
+
+
+def changed_sets(
+    sets_state: Dict[str, Dict[str, Any]],
+    crawled: Dict[str, Dict[str, Any]],
+    dropped: Set[str],
+    forced: Set[str],
+) -> Set[str]:
+    """Sets whose cards must be taken out of the previous mapping: those
+    whose content changed, forced or dropped."""
+    return {
+        set_code
+        for set_code, set_state in crawled.items()
+        if set_code in forced
+        or sets_state.get(set_code, {}).get("content_hash") != set_state["content_hash"]
+    } | dropped
+
+
+def stale_ids(
+    sets_state: Dict[str, Dict[str, Any]],
+    changed: Set[str],
+    overrides: Dict[str, str],
+    applied_overrides: Dict[str, str],
+) -> Set[int]:
+    """Cards of the previous mapping that aren't carried over as they are."""
+    # Cards also printed in an unchanged set stay
+    kept = set()
+    for set_code, set_state in sets_state.items():
+        if set_code not in changed:
+            kept.update(set_state["multiverse_ids"])
+
+    stale = set()
+    for set_code in changed:
+        stale.update(sets_state.get(set_code, {}).get("multiverse_ids", ()))
+
+    # Overrides of cards no set has (anymore) only live in the mapping; the
+    # sets of the others were crawled again, so their text is back
+    for key, value in applied_overrides.items():
+        if overrides.get(key) != value:
+            stale.add(int(key))
+
+    return stale - kept
+
+
+def ranked(
+    items: Iterable[Tuple[int, Any]], rank: int
+) -> Iterator[Tuple[int, int, Any]]:
+    for key, value in items:
+        yield key, rank, value
+
+
+def merged_mapping(
+    previous: Iterable[Tuple[int, List[Dict[str, str]]]],
+    stale: Set[int],
+    set_codes: List[str],
+    overrides: Dict[str, str],
+) -> Iterator[Tuple[int, List[Dict[str, str]]]]:
+    """
+    The new mapping, in multiverse ID order, from a k-way merge of the
+    previous mapping without its `stale` cards and the dumps of `set_codes`,
+    all sorted by ID, so that only one entry per source is in memory. When
+    several sources have a card, the dumps win over the previous mapping and
+    later dumps over earlier ones. Overrides apply last.
+    """
+    sources = [ranked(((key, value) for key, value in previous if key not in stale), 0)]
+    for rank, set_code in enumerate(set_codes, 1):
+        sources.append(ranked(iter_dump(set_code), rank))
+    override_rank = len(sources)
+    sources.append(ranked(sorted((int(key), value) for key, value in overrides.items()), override_rank))
+
+    for key, group in itertools.groupby(heapq.merge(*sources), key=lambda item: item[0]):
+        entry, override = None, None
+        for _, rank, value in group:
+            if rank == override_rank:
+                override = value
+            else:
+                entry = value
+
+        # Support manual text overrides, when necessary
+        if override is not None:
+            type_line = entry[0].get("original_type", "") if entry else ""
+            entry = mapping_entry(override, type_line)
+        if entry:
+            yield key, entry
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Map Gatherer multiverse IDs to their original printed text and type."
+    )
+    parser.add_argument("sets", nargs="*", help="Set codes to crawl (default: every set Gatherer lists)")
+    parser.add_argument("--full", action="store_true", help="Crawl every set and rebuild the mapping from scratch")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requests in flight at once")
+    parser.add_argument("--delay", type=float, help=f"Seconds between two requests (default: {POLITENESS_DELAY}, none offline)")
+    parser.add_argument("--output", type=pathlib.Path, default=pathlib.Path("outputs/gatherer_mapping.json"), help="Mapping to write")
+    parser.add_argument("--compact", action="store_true", help="Write the mapping without indentation")
+    parser.add_argument("--shard-size", type=int, metavar="IDS", help="Write the mapping as a directory of files of this many IDs each")
+    parser.add_argument("--fixtures", type=pathlib.Path, default=FIXTURES_DIR, help="Fixtures directory")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", action="store_true", help="Record every response as a fixture, bypassing the cache")
+    mode.add_argument("--offline", action="store_true", help="Replay recorded fixtures instead of reaching Gatherer")
+    args = parser.parse_args()
+
     pathlib.Path("caches").mkdir(parents=True, exist_ok=True)
     pathlib.Path("dumps").mkdir(parents=True, exist_ok=True)
+    delay = args.delay if args.delay is not None else (0 if args.offline else POLITENESS_DELAY)
+
+    # The previous mapping is only updated when it and the state it was
+    # built with are both there; otherwise everything is crawled again
+    mapping_path = args.output.with_suffix("") if args.shard_size else args.output
+    state = {} if args.full else load_state()
+    if not mapping_readable(mapping_path):
+        state = {}
+    sets_state = state.get("sets", {})
+    applied_overrides = state.get("overrides", {})
+    overrides = load_overrides()
+
+    # Sets with a card whose override changed are crawled again, to get back
+    # the card's own text
+    changed_overrides = {
+        int(key)
+        for key in overrides.keys() | applied_overrides.keys()
+        if overrides.get(key) != applied_overrides.get(key)
+    }
+    forced = {
+        set_code
+        for set_code, set_state in sets_state.items()
+        if changed_overrides.intersection(set_state["multiverse_ids"])
+    }
+
+    server = None
+    if args.offline:
+        server = ReplayServer(args.fixtures).start()
+        print(f"Replaying {len(server.index)} fixture(s) from {server.base_url}")
+        adapter = ReplayAdapter(server.base_url, pool_maxsize=args.concurrency)
+    elif args.record:
+        adapter = RecordingAdapter(args.fixtures, label=lambda: "gatherer", pool_maxsize=args.concurrency)
+    else:
+        adapter = None
+
+    session, polite = crawler_session(delay, args.concurrency, adapter)
+    cache = Uncached(session) if adapter else gatherer_cache(session)
+    downloader = GathererDownloader(cache)
+
+    # Only some sets may be crawled, but the forced ones always are
+    set_codes = sorted(set(args.sets) | forced) if args.sets else None
+
+    start = time.perf_counter()
+    try:
+        crawler = asyncio.run(crawl(downloader, set_codes, args.concurrency, sets_state, forced))
+    finally:
+        if server is not None:
+            server.stop()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Crawled {crawler.cards} cards of {len(crawler.crawled)}/{len(crawler.listed)} sets "
+        f"in {elapsed:.1f}s ({crawler.cards / elapsed:.1f} cards/s), {polite.sent} request(s) sent"
+    )
+    if server is not None:
+        server.report()
+
+    # Sets Gatherer no longer lists are dropped, unless only some were crawled
+    dropped = set() if args.sets else sets_state.keys() - crawler.listed
+    changed = changed_sets(sets_state, crawler.crawled, dropped, forced)
+    stale = stale_ids(sets_state, changed, overrides, applied_overrides)
+    previous = iter_mapping(mapping_path) if state else iter(())
+    count = write_mapping(
+        merged_mapping(previous, stale, sorted(changed - dropped), overrides),
+        mapping_path,
+        args.compact,
+        args.shard_size,
+    )
+    print(
+        f"Wrote {count} cards to {mapping_path}, updated from {len(changed)} changed set(s): "
+        f"{', '.join(sorted(changed)) or 'none'}"
+    )
 
-    set_codes = get_set_codes()
-
-    # Download all set data in parallel
-    with multiprocessing.Pool() as pool:
-        pool.map(download_set, set_codes)
-
-    combined_multiverse_id_to_printed_details_mappings = {}
-
-    # Load and merge each JSON file from 'dumps' into the combined dictionary
-    for done_set_path in pathlib.Path("dumps").glob("*.json"):
-        with done_set_path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            combined_multiverse_id_to_printed_details_mappings.update(data)
-
-    # Support manual text overrides, when necessary
-    with pathlib.Path("data/gatherer_multiverse_id_overrides.json").open(
-        "r", encoding="utf-8"
-    ) as fp:
-        for key, value in json.load(fp).items():
-            if key in combined_multiverse_id_to_printed_details_mappings:
-                combined_multiverse_id_to_printed_details_mappings[key]["text"] = value
-            else:
-                combined_multiverse_id_to_printed_details_mappings[key] = {
-                    "text": value,
-                    "type": "",
-                }
-
-    # Convert all keys to integers (they are strings in the JSON dumps)
-    final_result = {}
-    for key, value in combined_multiverse_id_to_printed_details_mappings.items():
-        text = value.get("text", "") if isinstance(value, dict) else value
-        type_line = value.get("type", "") if isinstance(value, dict) else ""
-        if text or type_line:
-            entry = {"original_text": text}
-            if type_line:
-                entry["original_type"] = type_line
-            final_result[int(key)] = [entry]
-    with pathlib.Path("outputs/gatherer_mapping.json").open(
-        "w", encoding="utf-8"
-    ) as fp:
-        json.dump(final_result, fp, indent=4, ensure_ascii=False, sort_keys=True)
+    for set_code in dropped:
+        del sets_state[set_code]
+    sets_state.update(crawler.crawled)
+    save_state({"sets": sets_state, "overrides": overrides})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""
+Cleanup of the original printed text and type line of Gatherer cards, as
+found in the page's <script> data, into what gatherer_mapping.json holds.
+
+Every pattern is compiled once, and each step is guarded by a substring
+check so that the common card (one face, no markup) only goes through the
+escape and mana substitutions. Markup is stripped with a tag pattern;
+anything a tag pattern can't handle exactly like BeautifulSoup's
+get_text() (entities, comments, script-like or preformatted elements, a
+stray "<") is still handed to BeautifulSoup.
+"""
+
+import re
+
+import bs4
+
+# Escaped newlines and quotes of the <script> data, in one pass
+ESCAPE_REGEX = re.compile(r'\\([n"])')
+ESCAPES = {"n": "\n", '"': '"'}
+
+SPLIT_CARD_REGEX = re.compile(r"(.*?)\n?///?\n(?:.*?\n){3}(.*)", re.DOTALL)
+# Mana symbols on older cards are wonky and not in the {0} etc. format we expect
+OLD_SCHOOL_MANA_REGEX = re.compile(r"o?o([0-9]+|[WUBRGX])")
+ADVENTURE_OMEN_TEXT_REGEX = re.compile(
+    r"(.*?)\n?//(?:ADV|OMEN)//\n(?:.*?\n){3}(.*)", re.DOTALL
+)
+FUSE_AND_DOORS_REGEX = re.compile(
+    r"(.*?)\n?///?\n(?:.*?\n){2}(.*)//\n?(.*)", re.DOTALL
+)
+CLASS_LEVEL_REGEX = re.compile(r"//Level_[0-9]+//\n")
+
+# A start or end tag without quoted attributes, like the <i> of reminder text
+HTML_TAG_REGEX = re.compile(r"</?[A-Za-z][^<>\"']*>")
+# Elements whose content get_text() leaves out or keeps the whitespace of
+SPECIAL_ELEMENT_REGEX = re.compile(r"<(?:script|style|template|pre|textarea)", re.IGNORECASE)
+# BeautifulSoup turns text made only of these into a single newline or space
+ASCII_SPACES_REGEX = re.compile(r"[ \n\t\x0c\r]+")
+
+
+def unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+    return ESCAPE_REGEX.sub(lambda match: ESCAPES[match.group(1)], text)
+
+
+def strip_components(card_text: str) -> str:
+    """Put the faces of adventure, omen, fuse, door, class and split cards
+    in the order and format of the mapping. All of them have a "//"."""
+    if "//ADV//" in card_text or "//OMEN//" in card_text:
+        match = ADVENTURE_OMEN_TEXT_REGEX.search(card_text)
+        if match:
+            card_text = f"{match.group(2)} // {match.group(1)}"
+
+    if "door" in card_text or "Fuse" in card_text:
+        match = FUSE_AND_DOORS_REGEX.search(card_text)
+        if match:
+            card_text = f"{match.group(1)} // {match.group(2)}{match.group(3)}"
+
+    if "Level_" in card_text:
+        card_text = CLASS_LEVEL_REGEX.sub("", card_text)
+
+    if "//" in card_text:
+        match = SPLIT_CARD_REGEX.search(card_text)
+        if match:
+            card_text = f"{match.group(1)} // {match.group(2)}"
+
+    return card_text
+
+
+def strip_html(card_text: str) -> str:
+    if "<" not in card_text:
+        return card_text
+
+    if not SPECIAL_ELEMENT_REGEX.search(card_text):
+        strings = HTML_TAG_REGEX.split(card_text)
+        stripped = "".join(strings)
+        if "<" not in stripped and "&" not in stripped:
+            return "".join(
+                ("\n" if "\n" in string else " ") if ASCII_SPACES_REGEX.fullmatch(string) else string
+                for string in strings
+            )
+
+    return bs4.BeautifulSoup(card_text, "html.parser").get_text()
+
+
+def clean_original_text(text: str) -> str:
+    if not text:
+        return ""
+
+    text = unescape(text)
+    if "//" in text:
+        text = strip_components(text)
+    if "o" in text:
+        text = OLD_SCHOOL_MANA_REGEX.sub(r"{\1}", text)
+    return strip_html(text)
+
+
+def clean_original_type(type_line: str) -> str:
+    if not type_line:
+        return ""
+
+    return strip_html(unescape(type_line))
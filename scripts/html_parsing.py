@@ -0,0 +1,53 @@
+"""
+HTML parsing backend shared by the scrapers (load_new_products and the
+Gatherer crawler).
+
+Pages are parsed with lxml when it is installed, falling back to Python's
+html.parser otherwise, and can be restricted to the few nodes a scraper
+actually reads so that the rest of the page is never turned into a tree.
+"""
+
+from typing import Dict, Optional, Tuple, Union
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# A tag name and the attributes it must carry, as given to find_all()
+Selector = Tuple[str, Dict[str, str]]
+
+
+def only(*selectors: Selector) -> SoupStrainer:
+    """
+    Build a strainer keeping only the subtrees rooted at tags matching one of
+    the selectors. Attribute values match like find_all() does: either the
+    whole attribute value, or one of its whitespace separated words (so
+    {"class": "card-body"} matches class="card-body col").
+    """
+
+    def matches(name: str, attrs: Dict[str, Union[str, list]]) -> bool:
+        for tag_name, tag_attrs in selectors:
+            if name != tag_name:
+                continue
+            for attr, value in tag_attrs.items():
+                actual = attrs.get(attr)
+                if isinstance(actual, list):
+                    actual = " ".join(actual)
+                if actual is None or (actual != value and value not in actual.split()):
+                    break
+            else:
+                return True
+        return False
+
+    return SoupStrainer(matches)
+
+
+def parse_html(
+    markup: Union[str, bytes], parse_only: Optional[SoupStrainer] = None
+) -> BeautifulSoup:
+    return BeautifulSoup(markup, PARSER, parse_only=parse_only)
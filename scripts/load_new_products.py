@@ -1,23 +1,237 @@
+import contextvars
+import itertools
 import json
+import math
 import re
 import sys
+import threading
+import time
 import unicodedata
-from datetime import datetime
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import requests
 import yaml
 
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 
+from html_parsing import only, parse_html
+from product_index import index_products, new_identifier_index
+from yaml_files import YamlWriter, load_yaml
+from response_cache import ResponseCache
+from retryable_session import retryable_session
+from sync_state import SyncState
+from tag_matcher import SkipRules, TagMatcher, skip_stats
+
 
 DEFAULT_TCGAPI_VERSION = "v1.39.0"
 
+# Requests are capped per host, as providers are scraped concurrently
+MAX_REQUESTS_PER_HOST = 4
+REQUEST_TIMEOUT = 60
+
+# One pooled, retrying session shared by every scraper, so connections (and
+# their TLS handshakes) are reused across the pages of a provider
+session = retryable_session(pool_maxsize=MAX_REQUESTS_PER_HOST)
+# Marketplaces were always queried with requests' own User-Agent (or a curl
+# one set per scraper), not the browser-like one of retryable_session
+session.headers["User-Agent"] = requests.utils.default_user_agent()
+
+# Catalog pages are cached for less than the interval between scheduled runs,
+# so that a rerun after a failure doesn't scrape everything again. The cache
+# is only opened by the first request, so importing this module (as the
+# benchmarks do) doesn't create its directory.
+http = None
+http_lock = threading.Lock()
+
+host_slots = defaultdict(lambda: threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST))
+host_slots_lock = threading.Lock()
+
+# Name of the provider the current thread is scraping for, for request_stats
+current_provider = contextvars.ContextVar("current_provider", default="other")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf")]
+
+
+class RequestStats:
+    """Per-provider request counts and latency histograms."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cached = defaultdict(int)
+        self.latencies = defaultdict(list)
+
+    def record(self, provider, elapsed, from_cache):
+        with self.lock:
+            if from_cache:
+                self.cached[provider] += 1
+            else:
+                self.latencies[provider].append(elapsed)
+
+    def report(self):
+        print("Request summary:")
+        header = " ".join(f"{'<' + format(b, 'g') + 's':>7}" for b in LATENCY_BUCKETS[:-1])
+        print(f"  {'provider':<16} {'cached':>6} {'fetched':>7} {'total s':>8}  {header} {'slower':>7}")
+        for provider in sorted(self.cached.keys() | self.latencies.keys()):
+            latencies = self.latencies[provider]
+            buckets = [0] * len(LATENCY_BUCKETS)
+            for elapsed in latencies:
+                buckets[next(i for i, b in enumerate(LATENCY_BUCKETS) if elapsed < b)] += 1
+            counts = " ".join(f"{count:>7}" for count in buckets)
+            print(
+                f"  {provider:<16} {self.cached[provider]:>6} {len(latencies):>7} "
+                f"{sum(latencies):>8.1f}  {counts}"
+            )
+
+
+request_stats = RequestStats()
+
+# What each provider fetched last run, for incremental syncs
+sync_state = SyncState()
+
+# TCGplayer groups published this recently are always refetched, as products
+# keep being added to new sets without their group being modified
+TCGPLAYER_RECENT_GROUP_DAYS = 90
+
+
+def response_cache():
+    global http
+    with http_lock:
+        if http is None:
+            http = ResponseCache("marketplaces", session, expire_after=timedelta(hours=6))
+        return http
+
+
+def http_request(method, url, **kwargs):
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    cache = response_cache()
+    host = urlparse(url).hostname
+    with host_slots_lock:
+        slot = host_slots[host]
+    with slot:
+        start = time.perf_counter()
+        response = cache.request(method, url, **kwargs)
+    request_stats.record(
+        current_provider.get(), time.perf_counter() - start, response.from_cache
+    )
+    return response
+
+
+def http_get(url, **kwargs):
+    return http_request("GET", url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    return http_request("POST", url, **kwargs)
+
+
+def fetch_if_changed(url, previous, **kwargs):
+    """GET a url unless it is unchanged since `previous`, the state saved
+    with validators() last run. Returns the response, or None if unchanged."""
+    headers = dict(kwargs.pop("headers", None) or {})
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+    r = http_get(url, headers=headers, **kwargs)
+    if r.status_code == 304:
+        return None
+    return r
+
+
+def validators(response):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+# Listing pages of the HTML scrapers, and the only nodes each one reads: the
+# product rows and the pagination marker. Everything else is skipped while
+# parsing instead of being built into a tree.
+MINIATUREMARKET_URL = "https://www.miniaturemarket.com/widgets/cms/navigation/be53d253d6bc3258a8160556dda3e9b2?no-aggregations=1&order=name-asc&p={}"
+MINIATUREMARKET_NODES = only(
+    ("div", {"class": "card-body"}),
+    ("li", {"class": "page-next"}),
+)
+COOLSTUFFINC_URL = "https://www.coolstuffinc.com/sq/1556988?page={}"
+COOLSTUFFINC_NODES = only(
+    ("div", {"class": "row product-search-row main-container"}),
+    ("span", {"id": "nextLink"}),
+)
+TROLLANDTOAD_URL = "https://www.trollandtoad.com/magic-the-gathering/magic-the-gathering-sealed-product/909?page-no={}"
+TROLLANDTOAD_NODES = only(
+    ("div", {"class": "product-info card-body col pl-0 pl-sm-3"}),
+    ("div", {"class": "pageText px-1 d-none d-md-block"}),
+)
+
+
+def paginate(fetch_page, parse_page, pages, window=None):
+    """Fetch and parse pages with up to `window` of them in flight at once
+    (MAX_REQUESTS_PER_HOST by default), so fetching a page overlaps with
+    parsing the previous ones.
+
+    fetch_page(page) returns the response for a page number; parse_page(page,
+    response) returns (items, is_last). `pages` may be open-ended (e.g.
+    itertools.count()) when the page count isn't known: pages are then
+    fetched ahead speculatively, until a page reports is_last (e.g. a short
+    or empty page). From then on no further page is submitted, queued ones
+    past it are dropped without being fetched, and the items of any that
+    were already in flight are discarded. Items are returned in page order."""
+    # Lowest page reported as the last one so far
+    last_page = None
+    last_page_lock = threading.Lock()
+
+    def past_last(page):
+        with last_page_lock:
+            return last_page is not None and page > last_page
+
+    def task(page):
+        nonlocal last_page
+        if past_last(page):
+            return [], True
+        page_items, is_last = parse_page(page, fetch_page(page))
+        if is_last:
+            with last_page_lock:
+                if last_page is None or page < last_page:
+                    last_page = page
+        return page_items, is_last
+
+    window = window or MAX_REQUESTS_PER_HOST
+    items = []
+    pages = iter(pages)
+    in_flight = deque()
+    executor = ThreadPoolExecutor(max_workers=window)
+    try:
+        def submit_next():
+            page = next(pages, None)
+            if page is not None and not past_last(page):
+                # Each task runs in a copy of our context so requests are
+                # still attributed to the provider in request_stats
+                context = contextvars.copy_context()
+                in_flight.append(executor.submit(context.run, task, page))
+
+        for _ in range(window):
+            submit_next()
+
+        while in_flight:
+            page_items, is_last = in_flight.popleft().result()
+            items.extend(page_items)
+            if is_last:
+                break
+            submit_next()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return items
+
 
 def get_cardKingdom():
     sealed_url = "https://api.cardkingdom.com/api/sealed_pricelist"
-    r = requests.get(sealed_url)
+    r = http_get(sealed_url)
     ck_data = json.loads(r.content)
     output_data = ck_data['data']
     output_data = [x for x in output_data if "Pure Bulk:" not in x['name']]
@@ -29,14 +243,17 @@ def tcgdownload(url, params, api_version, auth_code):
         "Authorization": f"Bearer {auth_code}"
     }  # Need to figure out the correct headers for TCG API
     # Need to figure out the correct version for TCG API
-    r = requests.get(
+    r = http_get(
         url.replace("[API_VERSION]", api_version), params=params, headers=header
     )
     # print(r.ok)
     return r.content
 
 
-def get_tcgplayer(api_version, auth_code):
+def get_tcgplayer(api_version, auth_code, previous_groups):
+    """Returns the sealed products and the state of each group they came from.
+    Groups in `previous_groups` that weren't modified since are reused as is,
+    unless recently published."""
     # get set ids
     magic_set_ids = []
     api_offset = 0
@@ -72,6 +289,8 @@ def get_tcgplayer(api_version, auth_code):
         "Bundle",
     ]
 
+    skip_rules = SkipRules("tcgplayer", skip_tags, sld_skip_tags)
+
     while True:
         api_response = tcgdownload(
             "https://api.tcgplayer.com/[API_VERSION]/catalog/categories/1/groups",
@@ -90,7 +309,12 @@ def get_tcgplayer(api_version, auth_code):
             break
 
         for magic_set in response["results"]:
-            magic_set_ids.append((magic_set["groupId"], magic_set["name"]))
+            magic_set_ids.append((
+                magic_set["groupId"],
+                magic_set["name"],
+                magic_set.get("modifiedOn"),
+                magic_set.get("publishedOn"),
+            ))
 
         api_offset += len(response["results"])
 
@@ -99,10 +323,29 @@ def get_tcgplayer(api_version, auth_code):
 
     print(f"Loaded {len(magic_set_ids)} sets")
 
+    recent = (datetime.now() - timedelta(days=TCGPLAYER_RECENT_GROUP_DAYS)).strftime("%Y-%m-%d")
     sealed_data = []
+    groups = dict()
+    reused = 0
     for group_id in magic_set_ids:
+        modified_on, published_on = group_id[2:]
+        previous = previous_groups.get(str(group_id[0]))
+        if (
+            previous is not None
+            and modified_on
+            and previous["modifiedOn"] == modified_on
+            and (published_on or "")[:10] < recent
+        ):
+            sealed_data.extend(previous["products"])
+            groups[str(group_id[0])] = previous
+            reused += 1
+            continue
+
+        group_data = []
+        # Only groups read to the end are saved, so a failed read isn't reused
+        complete = True
         api_offset = 0
-        print(group_id)
+        print(group_id[:2])
         while True:
             api_response = tcgdownload(
                 "https://api.tcgplayer.com/[API_VERSION]/catalog/products",
@@ -126,6 +369,7 @@ def get_tcgplayer(api_version, auth_code):
                 response = json.loads(api_response)
             except json.decoder.JSONDecodeError:
                 print(f"Unable to decode TCGPlayer API Response {api_response}")
+                complete = False
                 break
 
             if not response["results"]:
@@ -134,13 +378,9 @@ def get_tcgplayer(api_version, auth_code):
 
             for product in response["results"]:
                 product_name = product["cleanName"]
-                if any(tag.lower() in product_name.lower() for tag in skip_tags):
+                if skip_rules.check(product_name):
                     continue
 
-                if "Secret Lair" in product_name:
-                    if any(tag.lower() in product_name.lower() for tag in sld_skip_tags):
-                        continue
-
                 cleaned_data = [
                     {
                         "name": product_name,
@@ -148,7 +388,7 @@ def get_tcgplayer(api_version, auth_code):
                         "releaseDate": product["presaleInfo"].get("releasedOn"),
                     }
                 ]
-                sealed_data.extend(cleaned_data)
+                group_data.extend(cleaned_data)
 
             api_offset += len(response["results"])
 
@@ -156,13 +396,19 @@ def get_tcgplayer(api_version, auth_code):
             if len(response["results"]) < 100:
                 print(f"Found {api_offset} products")
                 break
-    return sealed_data
+
+        sealed_data.extend(group_data)
+        if complete and modified_on:
+            groups[str(group_id[0])] = {"modifiedOn": modified_on, "products": group_data}
+
+    print(f"Reused {reused}/{len(magic_set_ids)} unmodified groups")
+    return sealed_data, groups
 
 
 def get_tcg_auth_code(secret):
     if not secret:
         return DEFAULT_TCGAPI_VERSION, ""
-    tcg_post = requests.post(
+    tcg_post = session.post(
         "https://api.tcgplayer.com/token",
         data={
             "grant_type": "client_credentials",
@@ -181,13 +427,16 @@ def get_tcg_auth_code(secret):
     return api_version, str(request_as_json.get("access_token", ""))
 
 
-def get_cardmarket():
+def get_cardmarket(previous):
+    """Returns the sealed products and the catalog's state; an unchanged
+    catalog isn't parsed again."""
     product_list_url = "https://downloads.s3.cardmarket.com/productCatalog/productList/products_nonsingles_1.json"
-    r = requests.get(product_list_url)
-    mkm_data = json.loads(r.content)
-    product_list = mkm_data["products"]
+    r = fetch_if_changed(product_list_url, previous)
+    if r is None:
+        print(f"Catalog unchanged, reusing {len(previous['products'])} products")
+        return previous["products"], previous
 
-    category_types = [
+    category_types = {
         "Magic Booster",
         "Magic Display",
         "Magic Intropack",
@@ -196,7 +445,7 @@ def get_cardmarket():
         "Magic TournamentPack",
         "Magic Starter Deck",
         "MtG Set"
-    ]
+    }
 
     # "MtG Set" contains a mix of sealed product and bundles of cards
     # This list filters the bundles of cards away from all sets
@@ -256,21 +505,29 @@ def get_cardmarket():
         "Duel Deck"
     ]
 
+    # Sets and boosters of Secret Lair are bundles of its cards too
+    sld_skip_tags = [
+        " Set",
+        " Booster",
+    ]
+
+    skip_rules = SkipRules(
+        "cardMarket",
+        skip_tags,
+        TagMatcher(sld_skip_tags, ignore_case=False),
+        TagMatcher(full_set_ok, ignore_case=False),
+    )
+
     sealed_data = []
 
     # idProduct,Name,"Category ID","Category","Expansion ID","Metacard ID","Date Added"
-    for product in product_list:
+    # Most products are discarded on their category alone
+    for product in json.loads(r.content)["products"]:
         if product["categoryName"] not in category_types:
             continue
 
         product_name = product["name"]
-        if any(tag.lower() in product_name.lower() for tag in skip_tags):
-            continue
-        if "Full Set" in product_name and not any(tag in product_name for tag in full_set_ok):
-            continue
-        if "Secret Lair" in product_name and " Set" in product_name:
-            continue
-        if "Secret Lair" in product_name and " Booster" in product_name:
+        if skip_rules.check(product_name):
             continue
 
         sealed_data.extend([
@@ -283,14 +540,14 @@ def get_cardmarket():
 
     print(f"Parsed {len(sealed_data)} products")
 
-    return sealed_data
+    return sealed_data, {**validators(r), "products": sealed_data}
 
 
 def ctdownload(url, params, token):
     header = {
         "Authorization": f"Bearer {token}"
     }
-    r = requests.get(url, params=params, headers=header)
+    r = http_get(url, params=params, headers=header)
     return r.content
 
 
@@ -321,6 +578,8 @@ def load_cardtrader(secret):
         "Serialized",
     ]
 
+    skip_rules = SkipRules("cardTrader", skip_tags, sld_skip_tags)
+
     sealed_data = []
 
     for exp in mtgExpansions:
@@ -343,13 +602,9 @@ def load_cardtrader(secret):
             else:
                 product_name = blueprint["name"]
 
-            if any(tag.lower() in product_name.lower() for tag in skip_tags):
+            if skip_rules.check(product_name):
                 continue
 
-            if "Secret Lair" in product_name:
-                if any(tag.lower() in product_name.lower() for tag in sld_skip_tags):
-                    continue
-
             count += 1
             sealed_data.extend([
                 {
@@ -376,11 +631,17 @@ def preload_tcgplayer(secret):
 def load_tcgplayer(secret):
     api_version = secret.get("api_version")
     tcg_auth_code = secret.get("tcg_auth_code")
-    return get_tcgplayer(api_version, tcg_auth_code)
+    previous = sync_state.begin("tcgplayer")
+    sealed_data, groups = get_tcgplayer(api_version, tcg_auth_code, previous.get("groups", {}))
+    sync_state.commit("tcgplayer", {"groups": groups})
+    return sealed_data
 
 
 def load_cardmarket(secret):
-    return get_cardmarket()
+    previous = sync_state.begin("cardMarket")
+    sealed_data, state = get_cardmarket(previous)
+    sync_state.commit("cardMarket", state)
+    return sealed_data
 
 
 def load_miniaturemarket(secret):
@@ -400,29 +661,29 @@ def load_miniaturemarket(secret):
         "Omega Box",
         "In-Store Event",
     ]
+    skip_rules = SkipRules("miniaturemarket", skip_tags)
 
-    sealed_data = []
-
-    page = 0
-    while True:
-        page += 1
-        link = "https://www.miniaturemarket.com/widgets/cms/navigation/be53d253d6bc3258a8160556dda3e9b2?no-aggregations=1&order=name-asc&p=" + str(page)
-        print(f"Parsing page {page}")
-
+    def fetch_page(page):
+        link = MINIATUREMARKET_URL.format(page)
         header = {
             "User-Agent": "curl/8.6",
         }
-        r = requests.get(link, headers=header)
-        soup = BeautifulSoup(r.content, 'html.parser')
+        return http_get(link, headers=header)
+
+    def parse_page(page, r):
+        print(f"Parsing page {page}")
+        soup = parse_html(r.content, MINIATUREMARKET_NODES)
 
-        for div in soup.find_all('div', attrs={"class": "card-body"}):
+        sealed_data = []
+        divs = soup.find_all('div', attrs={"class": "card-body"})
+        for div in divs:
             try:
                 title = div.find('input', attrs={"name": "product-name"}).get("value")
                 mmId = div.find('input', attrs={"name": "product-id"}).get("value")
             except Exception:
                 continue
 
-            if any(tag.lower() in title.lower() for tag in skip_tags):
+            if skip_rules.check(title):
                 continue
 
             sealed_data.extend([
@@ -434,8 +695,10 @@ def load_miniaturemarket(secret):
 
         # Exit loop condition: stop when there's no "next" page link
         nextPage = soup.find('li', attrs={"class": "page-next"})
-        if not nextPage or "disabled" in nextPage.get("class", []):
-            break
+        is_last = not divs or not nextPage or "disabled" in nextPage.get("class", [])
+        return sealed_data, is_last
+
+    sealed_data = paginate(fetch_page, parse_page, itertools.count(1))
 
     print(f"Retrieved {len(sealed_data)} products")
 
@@ -458,7 +721,7 @@ def scgretaildownload(guid, page):
     payload["clientguid"] = guid
     payload["FacetSelections"] = facet
 
-    r = requests.post("https://starcitygamesv2.searchapi-na.hawksearch.com/api/v2/search", json=payload, headers=header)
+    r = http_post("https://starcitygamesv2.searchapi-na.hawksearch.com/api/v2/search", json=payload, headers=header)
     return json.loads(r.content)
 
 
@@ -476,7 +739,7 @@ def scgbuylistdownload(bearer, offset, limit):
     payload["limit"] = limit
     payload["sort"] = ["name:asc", "set_name:asc", "finish:desc"]
 
-    r = requests.post("https://search.starcitygames.com/indexes/sell_list_products_v2/search", json=payload, headers=header)
+    r = http_post("https://search.starcitygames.com/indexes/sell_list_products_v2/search", json=payload, headers=header)
     return json.loads(r.content)
 
 
@@ -495,11 +758,9 @@ def load_starcity(secret):
 
 def load_starcity_retail(secret):
     guid = secret.get("scg_guid")
-    sealed_data = []
 
-    numOfPages = scgretaildownload(guid, 0)["Pagination"]["NofPages"]
-    for page in range(1, numOfPages + 1):
-        resp = scgretaildownload(guid, page)
+    def parse_page(page, resp):
+        sealed_data = []
         for result in resp["Results"]:
             title = result["Document"]["item_display_name"][0]
             subtitles = result["Document"].get("subtitle")
@@ -516,8 +777,14 @@ def load_starcity_retail(secret):
                     "id": scgId,
                 }
             ])
+        return sealed_data, not resp["Results"]
 
-    return sealed_data
+    numOfPages = scgretaildownload(guid, 0)["Pagination"]["NofPages"]
+    return paginate(
+        lambda page: scgretaildownload(guid, page),
+        parse_page,
+        range(1, numOfPages + 1),
+    )
 
 
 def load_starcity_buylist(secret):
@@ -571,12 +838,15 @@ def load_coolstuffinc(secret):
         "Token Set",
         "Variety Pack",
     ]
+    skip_rules = SkipRules("coolstuffinc", skip_tags)
 
-    retail_data = load_coolstuffinc_retail(skip_tags)
+    retail_data = load_coolstuffinc_retail(skip_rules)
     print(f"Retrieved {len(retail_data)} products from retail")
 
     try:
-        buylist_data = load_coolstuffinc_buylist(skip_tags)
+        previous = sync_state.begin("coolstuffinc")
+        buylist_data, buylist_state = load_coolstuffinc_buylist(skip_rules, previous.get("buylist", {}))
+        sync_state.commit("coolstuffinc", {"buylist": buylist_state})
         print(f"Retrieved {len(buylist_data)} products from buylist")
 
         retail_data.extend(x for x in buylist_data if x not in retail_data)
@@ -588,29 +858,28 @@ def load_coolstuffinc(secret):
     return retail_data
 
 
-def load_coolstuffinc_retail(skip_tags):
-    sealed_data = []
-
-    page = 0
-    while True:
-        page += 1
-        link = "https://www.coolstuffinc.com/sq/1556988?page=" + str(page)
-        print(f"Parsing page {page}")
-
+def load_coolstuffinc_retail(skip_rules):
+    def fetch_page(page):
+        link = COOLSTUFFINC_URL.format(page)
         header = {
             "User-Agent": "curl/8.6",
         }
-        r = requests.get(link, headers=header)
-        soup = BeautifulSoup(r.content, 'html.parser')
+        return http_get(link, headers=header)
+
+    def parse_page(page, r):
+        print(f"Parsing page {page}")
+        soup = parse_html(r.content, COOLSTUFFINC_NODES)
 
-        for div in soup.find_all('div', attrs={"class": "row product-search-row main-container"}):
+        sealed_data = []
+        divs = soup.find_all('div', attrs={"class": "row product-search-row main-container"})
+        for div in divs:
             try:
                 title = div.find('span', attrs={"itemprop": "name"}).get_text()
                 productURL = div.find('link', attrs={"itemprop": "url"}).get("content")
             except Exception:
                 continue
 
-            if any(tag.lower() in title.lower() for tag in skip_tags):
+            if skip_rules.check(title):
                 continue
 
             u = urlparse(productURL)
@@ -625,19 +894,24 @@ def load_coolstuffinc_retail(skip_tags):
 
         # Exit loop condition, only when the Next field has no future links
         nextPage = soup.find('span', attrs={"id": "nextLink"})
-        if not nextPage or not nextPage.find('a'):
-            break
+        is_last = not divs or not nextPage or not nextPage.find('a')
+        return sealed_data, is_last
 
-    return sealed_data
+    return paginate(fetch_page, parse_page, itertools.count(1))
 
 
-def load_coolstuffinc_buylist(skip_tags):
+def load_coolstuffinc_buylist(skip_rules, previous):
+    """Returns the buylist's sealed products and its state; an unchanged
+    buylist isn't parsed again."""
     sealed_data = []
 
     header = {
         "User-Agent": "curl/8.6",
     }
-    r = requests.get("https://www.coolstuffinc.com/GeneratedFiles/SellList/Section-mtg.json", headers=header)
+    r = fetch_if_changed("https://www.coolstuffinc.com/GeneratedFiles/SellList/Section-mtg.json", previous, headers=header)
+    if r is None:
+        print(f"Buylist unchanged, reusing {len(previous['products'])} products")
+        return previous["products"], previous
     buylist = json.loads(r.content)
 
     for product in buylist:
@@ -646,7 +920,7 @@ def load_coolstuffinc_buylist(skip_tags):
 
         name = product.get("Name")
 
-        if any(tag.lower() in name.lower() for tag in skip_tags):
+        if skip_rules.check(name):
             continue
 
         sealed_data.extend([
@@ -656,7 +930,7 @@ def load_coolstuffinc_buylist(skip_tags):
             }
         ])
 
-    return sealed_data
+    return sealed_data, {**validators(r), "products": sealed_data}
 
 
 def get_abu_link(page, limit):
@@ -664,70 +938,73 @@ def get_abu_link(page, limit):
 
 
 def load_abugames(_):
-    sealed_data = []
-
     skip_tags = [
         "VHS Video",
     ]
+    skip_rules = SkipRules("abugames", skip_tags)
 
-    page = 0
     limit = 40
-    while True:
-        print(f"Parsing page {page}")
-        link = get_abu_link(page, limit)
-
-        header = {
-            "User-Agent": "curl/8.6",
-        }
-        r = requests.get(link, headers=header)
-        data = json.loads(r.content)
-        response = data.get("response")
-
-        docs = response.get("docs")
-        if len(docs) == 0:
-            break
-        page += 1
+    header = {
+        "User-Agent": "curl/8.6",
+    }
 
-        for product in docs:
-            product_id = product.get("id")
-            name = product.get("display_title")
+    def fetch_page(page):
+        return http_get(get_abu_link(page, limit), headers=header)
 
-            if product.get("language_magic_sealed_product")[0] != "English":
-                continue
+    def parse_page(page, r):
+        print(f"Parsing page {page}")
+        docs = json.loads(r.content).get("response").get("docs")
+        return docs, len(docs) < limit
+
+    # The first page tells how many pages there are
+    print("Parsing page 0")
+    first_page = json.loads(fetch_page(0).content).get("response")
+    num_found = first_page.get("numFound", 0)
+    docs = first_page.get("docs") + paginate(
+        fetch_page, parse_page, range(1, math.ceil(num_found / limit))
+    )
 
-            if name.endswith("(Loose)"):
-                added = False
-                for i in range(len(sealed_data)):
-                    if name.startswith(sealed_data[i].get("name")):
-                        sealed_data[i]["name"] = name
-                        sealed_data[i]["id"] = product_id
-                        added = True
-                if added:
-                    continue
+    sealed_data = []
+    # name -> indices into sealed_data, to find the sealed entries a "(Loose)"
+    # listing replaces by looking up each prefix of its name
+    by_name = defaultdict(list)
+    for product in docs:
+        product_id = product.get("id")
+        name = product.get("display_title")
+
+        if product.get("language_magic_sealed_product")[0] != "English":
+            continue
 
-            if any(tag.lower() in name.lower() for tag in skip_tags):
+        if name.endswith("(Loose)"):
+            replaced = [
+                i for end in range(len(name) + 1) for i in by_name.pop(name[:end], [])
+            ]
+            for i in replaced:
+                sealed_data[i]["name"] = name
+                sealed_data[i]["id"] = product_id
+            by_name[name].extend(replaced)
+            if replaced:
                 continue
 
-            # some older products have outdated conditions
-            if product.get("condition") != "NM":
-                continue
+        if skip_rules.check(name):
+            continue
 
-            sealed_data.extend([
-                {
-                    "name": name,
-                    "id": product_id,
-                }
-            ])
+        # some older products have outdated conditions
+        if product.get("condition") != "NM":
+            continue
 
-        if len(docs) < limit:
-            break
+        by_name[name].append(len(sealed_data))
+        sealed_data.extend([
+            {
+                "name": name,
+                "id": product_id,
+            }
+        ])
 
     return sealed_data
 
 
 def load_tnt(_):
-    sealed_data = []
-
     skip_tags = [
         "Omega Collector",
         "Silver Stamped",
@@ -740,20 +1017,22 @@ def load_tnt(_):
         "French",
         "Chinese",
     ]
+    skip_rules = SkipRules("trollandtoad", skip_tags)
 
-    page = 0
-    while True:
-        page += 1
-        link = "https://www.trollandtoad.com/magic-the-gathering/magic-the-gathering-sealed-product/909?page-no=" + str(page)
-        print(f"Parsing page {page}")
-
+    def fetch_page(page):
+        link = TROLLANDTOAD_URL.format(page)
         header = {
             "User-Agent": "curl/8.6",
         }
-        r = requests.get(link, headers=header)
-        soup = BeautifulSoup(r.content, 'html.parser')
+        return http_get(link, headers=header)
+
+    def parse_page(page, r):
+        print(f"Parsing page {page}")
+        soup = parse_html(r.content, TROLLANDTOAD_NODES)
 
-        for div in soup.find_all('div', attrs={"class": "product-info card-body col pl-0 pl-sm-3"}):
+        sealed_data = []
+        divs = soup.find_all('div', attrs={"class": "product-info card-body col pl-0 pl-sm-3"})
+        for div in divs:
             try:
                 name = div.find('div', attrs={"class": "col-11 prod-title"}).get_text().strip()
                 productURL = div.find('a', attrs={"class": "card-text"}).get("href")
@@ -761,7 +1040,7 @@ def load_tnt(_):
             except Exception:
                 continue
 
-            if any(tag.lower() in name.lower() for tag in skip_tags):
+            if skip_rules.check(name):
                 continue
 
             tntId = productURL.rsplit('/', 1)[-1]
@@ -776,10 +1055,9 @@ def load_tnt(_):
 
         # Exit loop condition, only when the Next field has no future links
         nextPage = soup.find('div', attrs={"class": "pageText px-1 d-none d-md-block"})
-        if not nextPage:
-            break
+        return sealed_data, not divs or not nextPage
 
-    return sealed_data
+    return paginate(fetch_page, parse_page, itertools.count(1))
 
 
 def normalize_hareruya_name(name):
@@ -861,6 +1139,7 @@ def load_hareruya(_):
         "[SC]", "Simplified Chinese", "【SC】", "[CT]", "【CT】",
         "[KOR]",
     ]
+    skip_rules = SkipRules("hareruya", TagMatcher(non_english_tags, ignore_case=False))
 
     # Language markers that only appear in the Japanese title (the English
     # title is sometimes left untagged, e.g. Traditional Chinese boosters)
@@ -891,7 +1170,7 @@ def load_hareruya(_):
         header = {
             "User-Agent": "curl/8.6",
         }
-        r = requests.get(link, headers=header)
+        r = http_get(link, headers=header)
         docs = json.loads(r.content).get("response", {}).get("docs", [])
 
         # Exit loop condition: stop once a page returns no more products
@@ -903,7 +1182,7 @@ def load_hareruya(_):
             if not name:
                 continue
 
-            if any(tag in name for tag in non_english_tags):
+            if skip_rules.check(name):
                 continue
 
             # Some non-English products are only marked in the Japanese title
@@ -1019,7 +1298,27 @@ providers_dict = {
 }
 
 
-def main(secret):
+def run_provider(key, provider, secret):
+    """Run one provider's load_func, returning (products, seconds, error)."""
+    current_provider.set(key)
+    start = time.perf_counter()
+    try:
+        products = provider["load_func"](secret)
+        error = None
+    except Exception as e:
+        print(f"Could not load provider {key}")
+        print(repr(e))
+        products = [{
+            "name": f"Could not load provider {key}",
+            "id": ""
+        }]
+        error = e
+    return products, time.perf_counter() - start, error
+
+
+def main(secret, full=False):
+    sync_state.load(full=full)
+
     # Load any prerequisite data (auth or similar)
     for provider in providers_dict.values():
         if provider.get("disabled") or provider.get("preload_func") is None:
@@ -1041,54 +1340,63 @@ def main(secret):
         ids[key] = provider_ids
         reviews[key] = dict()
 
-    # Load data from the known products
-    for known_file in Path("data/products").glob("*.yaml"):
-        with open(known_file, "r") as yfile:
-            loaded_data = yaml.safe_load(yfile)
-        with open(known_file, "w") as yfile:
-            yaml.safe_dump(loaded_data, yfile)
+    # Index every known id of the known products in a single pass, and
+    # normalize the files that aren't yet
+    yaml_writer = YamlWriter()
+    known_ids = new_identifier_index()
+    known_data = dict()
+    for known_file in sorted(Path("data/products").glob("*.yaml")):
+        raw = known_file.read_bytes()
+        loaded_data = load_yaml(raw)
+        if not yaml_writer.is_normalized(known_file, raw):
+            yaml_writer.write(known_file, loaded_data, raw)
+
+        index_products(known_ids, known_file.stem, loaded_data["products"])
+        known_data[known_file] = loaded_data
+
+    # Scrape every provider concurrently, then merge the results in the
+    # providers_dict order so review.yaml doesn't depend on who finished first
+    enabled = {k: p for k, p in providers_dict.items() if not p.get("disabled")}
+    with ThreadPoolExecutor(max_workers=max(len(enabled), 1)) as executor:
+        futures = {
+            key: executor.submit(run_provider, key, provider, secret)
+            for key, provider in enabled.items()
+        }
+    results = {key: future.result() for key, future in futures.items()}
 
-        # For each provider, load every known id
-        for key, provider in providers_dict.items():
-            if provider.get("disabled"):
-                continue
-            ids[key].update(
-                {
-                    str(p["identifiers"][provider["identifier"]])
-                    for p in loaded_data["products"].values()
-                    if "identifiers" in p and p["identifiers"].get(provider["identifier"])
-                }
-            )
+    print("Provider summary:")
+    for key, (products, elapsed, error) in results.items():
+        status = f"FAILED {error!r}" if error else f"{len(products)} products"
+        print(f"  {key:<16} {elapsed:7.1f}s  {status}")
+    request_stats.report()
+    skip_stats.report()
+    sync_state.save()
 
     # Update all the ids
-    for key, provider in providers_dict.items():
-        if provider.get("disabled"):
-            continue
-        try:
-            products = provider["load_func"](secret)
-        except Exception as e:
-            print(f"Could not load provider {key}")
-            print(repr(e))
-            products = [{
-                "name": f"Could not load provider {key}",
-                "id": ""
-            }]
+    for key, provider in enabled.items():
+        products = results[key][0]
+        provider_known_ids = known_ids[provider["identifier"]]
+        # Last suffix handed out per name, so duplicate names resume numbering
+        # where they left off instead of probing from 1 every time
+        name_suffixes = dict()
 
         for product in products:
-            if str(product["id"]) in ids[key]:
+            product_id = str(product["id"])
+            if product_id in ids[key] or product_id in provider_known_ids:
                 continue
 
             prod_name = product["name"]
-            i = 0
+            i = name_suffixes.get(product["name"], 0)
             while prod_name in reviews[key]:
                 i = i + 1
                 prod_name = product["name"] + " " + str(i)
+            name_suffixes[product["name"]] = i
             reviews[key][prod_name] = {
-                "identifiers": {provider["identifier"]: str(product["id"])},
+                "identifiers": {provider["identifier"]: product_id},
                 "category": "UNKNOWN",
                 "subtype": "UNKNOWN"
             }
-            ids[key].add(str(product["id"]))
+            ids[key].add(product_id)
             if product.get("releaseDate") is not None:
                 try:
                     date_obj = datetime.strptime(product["releaseDate"], "%Y-%m-%dT%H:%M:%S")
@@ -1102,36 +1410,44 @@ def main(secret):
         yaml.safe_dump(reviews, yfile)
 
     # Add any new/modified products to the contents files
-    for set_file in Path("data/products").glob("*.yaml"):
-        with open(set_file, "r") as yfile:
-            load_data = yaml.safe_load(yfile)
+    for set_file, load_data in known_data.items():
         cpath = Path("data/contents").joinpath(set_file.name)
+        raw = None
         if cpath.is_file():
-            with open(cpath, "r") as yfile:
-                content_data = yaml.safe_load(yfile)
+            raw = cpath.read_bytes()
+            content_data = load_yaml(raw)
         else:
             content_data = {"code": load_data['code'], "products":{}}
+        modified = raw is None
         for p_name in load_data["products"].keys():
             if p_name not in content_data["products"]:
                 content_data["products"][p_name] = {}
+                modified = True
         removes = []
         for p_name, p_cont in content_data["products"].items():
             if not p_cont and p_name not in load_data["products"]:
                 removes.append(p_name)
         for n in removes:
             content_data["products"].pop(n)
-        with open(Path("data/contents").joinpath(set_file.name), "w") as yfile:
-            yaml.safe_dump(content_data, yfile)
+            modified = True
+        if modified or not yaml_writer.is_normalized(cpath, raw):
+            yaml_writer.write(cpath, content_data, raw)
+
+    yaml_writer.save()
+    yaml_writer.report()
 
 
 if __name__ == "__main__":
     # Optional --<scraper> flags restrict the run to those scrapers and skip
-    # the rest. Pull them out before parsing the auth blob so its existing
-    # parsing stays intact.
+    # the rest, and --full ignores the incremental sync state. Pull them out
+    # before parsing the auth blob so its existing parsing stays intact.
     selected = set()
+    full = False
     auth_args = []
     for arg in sys.argv[1:]:
-        if arg.startswith("--"):
+        if arg == "--full":
+            full = True
+        elif arg.startswith("--"):
             name = arg[2:]
             if name not in providers_dict:
                 print(f"Unknown scraper '{arg}'. Available: {', '.join(sorted(providers_dict))}")
@@ -1158,4 +1474,4 @@ if __name__ == "__main__":
             print(f"{key} is disabled due missing auth")
             providers_dict[key]["disabled"] = True
 
-    main(secret)
+    main(secret, full)
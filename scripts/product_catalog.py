@@ -0,0 +1,62 @@
+"""
+Snapshot of the known products (name, set file, category) of data/products,
+cached in caches/product_catalog.json so that interactive tools don't parse
+every products file at startup.
+
+A file is only parsed again when it changed: its size and mtime are checked
+first, and when they differ its hash decides (a checkout touches mtimes
+without changing the content).
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+from yaml_files import load_yaml
+
+CATALOG_PATH = Path("caches/product_catalog.json")
+CATALOG_VERSION = 1
+
+
+def load_catalog(products_dir=Path("data/products"), catalog_path=CATALOG_PATH):
+    """Returns [(product name, set file, category)] in set file order."""
+    cached = {}
+    if catalog_path.is_file():
+        with open(catalog_path) as catalog_file:
+            catalog = json.load(catalog_file)
+        if catalog.get("version") == CATALOG_VERSION:
+            cached = catalog["files"]
+
+    files = {}
+    parsed = 0
+    for product_file in sorted(products_dir.glob("*.yaml")):
+        stat = product_file.stat()
+        entry = cached.get(str(product_file))
+        if entry is None or (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            raw = product_file.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            if entry is None or entry["sha256"] != digest:
+                products = load_yaml(raw)["products"]
+                entry = {
+                    "sha256": digest,
+                    "products": [
+                        [name, (product or {}).get("category")] for name, product in products.items()
+                    ],
+                }
+                parsed += 1
+            # A new dict, so that `cached` still tells the catalog is stale
+            entry = {**entry, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        files[str(product_file)] = entry
+
+    if files != cached:
+        catalog_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(catalog_path, "w") as catalog_file:
+            json.dump({"version": CATALOG_VERSION, "files": files}, catalog_file)
+    if parsed:
+        print(f"Parsed {parsed}/{len(files)} products files")
+
+    return [
+        (name, Path(path), category)
+        for path, entry in files.items()
+        for name, category in entry["products"]
+    ]
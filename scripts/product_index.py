@@ -0,0 +1,34 @@
+"""
+Index of every marketplace identifier used by the known products, built in
+one pass over data/products:
+
+    identifier key (e.g. "tcgplayerProductId") -> id -> (set code, product name)
+
+Ids are kept as strings, as the scrapers and review.yaml use them.
+"""
+
+from collections import defaultdict
+from pathlib import Path
+
+import yaml
+
+
+def new_identifier_index():
+    return defaultdict(dict)
+
+
+def index_products(index, set_code, products):
+    """Add the identifiers of one data/products file's products to the index."""
+    for product_name, product in products.items():
+        for key, value in (product.get("identifiers") or {}).items():
+            if value:
+                index[key][str(value)] = (set_code, product_name)
+
+
+def load_identifier_index(products_dir=Path("data/products")):
+    index = new_identifier_index()
+    for product_file in sorted(products_dir.glob("*.yaml")):
+        with open(product_file) as yfile:
+            loaded_data = yaml.safe_load(yfile)
+        index_products(index, product_file.stem, loaded_data["products"])
+    return index
@@ -0,0 +1,234 @@
+"""
+Record marketplace responses into fixtures and replay them from a local
+stand-in HTTP server, so the load_new_products providers can be exercised
+without network access or credentials.
+
+Both sides hook into a requests.Session through transport adapters, so the
+scrapers themselves run unchanged:
+
+  - RecordingAdapter saves every response it receives under
+    <fixtures>/<label>/<digest>.gz
+  - ReplayAdapter sends every request to a ReplayServer instead, which
+    answers from those fixtures, optionally after an artificial latency or
+    with an injected server error
+
+Fixtures are keyed like the response cache entries: by method, full URL and
+body. Headers (and so bearer tokens) aren't part of the key nor recorded.
+"""
+
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests.adapters
+
+FIXTURES_DIR = Path("fixtures/marketplaces")
+
+# Carries the original URL of a replayed request to the server
+REPLAY_URL_HEADER = "X-Replay-Url"
+
+# Headers that describe the transfer rather than the (already decoded) body
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def fixture_digest(method, url, body):
+    if body is None:
+        body = b""
+    elif isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha256(b"\0".join([method.upper().encode(), url.encode(), body])).hexdigest()
+
+
+class Uncached:
+    """Stands in for a ResponseCache, sending every request to the network
+    so that each one is recorded or replayed."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        response = self.session.request(method, url, **kwargs)
+        response.from_cache = False
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter saving every response it receives as a fixture.
+    `label` is called for each request to name the subdirectory it is saved
+    in (e.g. the provider being scraped)."""
+
+    def __init__(self, fixtures=FIXTURES_DIR, label=lambda: "other", **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures = fixtures
+        self.label = label
+        self.recorded = Counter()
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+
+        meta = {
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {
+                key: value
+                for key, value in response.headers.items()
+                if key.lower() not in DROPPED_HEADERS
+            },
+        }
+        label = self.label()
+        path = self.fixtures.joinpath(
+            label, f"{fixture_digest(request.method, request.url, request.body)}.gz"
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(gzip.compress(json.dumps(meta).encode("utf-8") + b"\n" + response.content))
+        self.recorded[label] += 1
+        return response
+
+
+class ReplayAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter sending every request to a ReplayServer at `base_url`,
+    whatever host it was meant for."""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        request = request.copy()
+        original = urlparse(request.url)
+        request.headers[REPLAY_URL_HEADER] = request.url
+        request.url = self.base_url + (original.path or "/") + (
+            f"?{original.query}" if original.query else ""
+        )
+        return super().send(request, **kwargs)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Local HTTP server answering requests from recorded fixtures.
+
+    :param fixtures: Directory the fixtures were recorded to
+    :param latency: Seconds each response is delayed by
+    :param jitter: Up to this many extra seconds, drawn uniformly per request
+    :param error_rate: Fraction of requests answered with `error_status` instead
+    :param error_status: Status of the injected errors (500 is retried by the
+        scrapers' session, other statuses reach the scrapers)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fixtures=FIXTURES_DIR, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, seed=None):
+        super().__init__(("127.0.0.1", 0), ReplayHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.served = Counter()
+        self.errors = Counter()
+        self.missing = Counter()
+
+        # digest -> fixture path; bodies are only read when requested
+        self.index = {path.stem: path for path in fixtures.glob("*/*.gz")}
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def next_delay_and_error(self):
+        with self.lock:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            return delay, self.random.random() < self.error_rate
+
+    def count(self, counter, url):
+        with self.lock:
+            counter[urlparse(url).hostname] += 1
+
+    def report(self):
+        print("Replay server summary:")
+        print(f"  {'host':<48} {'served':>7} {'errors':>7} {'missing':>7}")
+        for host in sorted(self.served.keys() | self.errors.keys() | self.missing.keys()):
+            print(
+                f"  {host:<48} {self.served[host]:>7} {self.errors[host]:>7} {self.missing[host]:>7}"
+            )
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.replay()
+
+    def do_POST(self):
+        self.replay()
+
+    def replay(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        url = self.headers.get(REPLAY_URL_HEADER, self.path)
+
+        delay, fail = server.next_delay_and_error()
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            server.count(server.errors, url)
+            self.respond(server.error_status, {}, b"Injected error")
+            return
+
+        path = server.index.get(fixture_digest(self.command, url, body))
+        if path is None:
+            server.count(server.missing, url)
+            self.respond(404, {}, f"No fixture for {self.command} {url}".encode("utf-8"))
+            return
+
+        header, _, content = gzip.decompress(path.read_bytes()).partition(b"\n")
+        meta = json.loads(header)
+        server.count(server.served, url)
+        self.respond(meta["status"], meta["headers"], content)
+
+    def respond(self, status, headers, content):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Keep the benchmark output readable
+        pass
@@ -0,0 +1,221 @@
+"""
+On-disk HTTP response cache shared by every provider (TCGplayer tokens,
+Gatherer and the load_new_products marketplaces).
+
+Entries are content-addressed by the request (method, full URL and body),
+stored gzip-compressed under caches/http/<name>/, served without touching
+the network while fresh, revalidated with ETag/Last-Modified once stale,
+and evicted least-recently-used when a namespace outgrows its size budget.
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+import requests.structures
+import requests.utils
+
+CACHE_ROOT = pathlib.Path("caches/http")
+
+# Statuses that are safe to replay; 404 is included so that empty pages
+# (e.g. TCGplayer offsets past the last product) are not refetched either
+CACHEABLE_STATUSES = {200, 203, 300, 301, 404, 410}
+
+# Headers that describe the transfer rather than the (already decoded) body
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class ResponseCache:
+    name: str
+    session: requests.Session
+    expire_after: datetime.timedelta
+    max_size: int
+    __directory: pathlib.Path
+    __lock: threading.Lock
+    __size: Optional[int]
+
+    def __init__(
+        self,
+        name: str,
+        session: Optional[requests.Session] = None,
+        expire_after: datetime.timedelta = datetime.timedelta(days=1),
+        max_size: int = 1024**3,
+    ) -> None:
+        """
+        :param name: Namespace of the cache, one directory per provider family
+        :param session: Session used for network requests (a plain one if omitted)
+        :param expire_after: How long an entry is served without revalidation
+        :param max_size: Size budget in bytes before the oldest entries are evicted
+        """
+        self.name = name
+        self.session = session if session is not None else requests.Session()
+        self.expire_after = expire_after
+        self.max_size = max_size
+        self.__directory = CACHE_ROOT.joinpath(name)
+        self.__directory.mkdir(parents=True, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__size = None
+
+    def close(self) -> None:
+        self.session.close()
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Drop-in replacement for Session.request. Cached responses carry
+        `from_cache = True`; anything coming off the network `False`.
+        """
+        path = self.__path(method, url, kwargs)
+        entry = self.__read(path)
+        if entry and time.time() - entry[0]["stored_at"] < self.expire_after.total_seconds():
+            return self.__to_response(*entry, from_cache=True)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry:
+            # Stored as the server sent them, which may be in any case
+            stored_headers = requests.structures.CaseInsensitiveDict(entry[0]["headers"])
+            if stored_headers.get("ETag"):
+                headers["If-None-Match"] = stored_headers["ETag"]
+            if stored_headers.get("Last-Modified"):
+                headers["If-Modified-Since"] = stored_headers["Last-Modified"]
+
+        try:
+            response = self.session.request(method, url, headers=headers, **kwargs)
+        except requests.RequestException as exception:
+            if not entry:
+                raise
+            print(f"Serving stale {url} from cache: {exception!r}")
+            return self.__to_response(*entry, from_cache=True)
+
+        if response.status_code == 304 and entry:
+            meta, body = entry
+            meta["stored_at"] = time.time()
+            self.__write(path, meta, body)
+            return self.__to_response(meta, body, from_cache=True)
+
+        if response.status_code >= 500 and entry:
+            print(f"Serving stale {url} from cache: HTTP {response.status_code}")
+            return self.__to_response(*entry, from_cache=True)
+
+        if response.status_code in CACHEABLE_STATUSES:
+            meta = {
+                "url": response.url,
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": {
+                    key: value
+                    for key, value in response.headers.items()
+                    if key.lower() not in DROPPED_HEADERS
+                },
+                "stored_at": time.time(),
+            }
+            self.__write(path, meta, response.content)
+
+        response.from_cache = False
+        return response
+
+    def __path(self, method: str, url: str, kwargs: Dict[str, Any]) -> pathlib.Path:
+        # Only what identifies the resource goes into the key; headers such
+        # as Authorization change between runs without changing the content
+        prepared = requests.Request(
+            method.upper(),
+            url,
+            params=kwargs.get("params"),
+            data=kwargs.get("data"),
+            json=kwargs.get("json"),
+        ).prepare()
+
+        body = prepared.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        digest = hashlib.sha256(
+            b"\0".join([prepared.method.encode(), prepared.url.encode(), body])
+        ).hexdigest()
+        return self.__directory.joinpath(digest[:2], f"{digest}.gz")
+
+    @staticmethod
+    def __read(path: pathlib.Path) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        try:
+            raw = gzip.decompress(path.read_bytes())
+            # Mark as recently used for the LRU eviction
+            os.utime(path)
+        except (OSError, EOFError, gzip.BadGzipFile):
+            return None
+
+        header, _, body = raw.partition(b"\n")
+        try:
+            return json.loads(header), body
+        except json.decoder.JSONDecodeError:
+            return None
+
+    def __write(self, path: pathlib.Path, meta: Dict[str, Any], body: bytes) -> None:
+        payload = gzip.compress(
+            json.dumps(meta).encode("utf-8") + b"\n" + body, compresslevel=6
+        )
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}")
+        temp_path.write_bytes(payload)
+
+        previous_size = path.stat().st_size if path.exists() else 0
+        os.replace(temp_path, path)
+
+        with self.__lock:
+            if self.__size is None:
+                self.__size = sum(size for _, size, _ in self.__stat_entries())
+            else:
+                self.__size += len(payload) - previous_size
+
+            if self.__size > self.max_size:
+                self.__evict()
+
+    def __stat_entries(self) -> Iterator[Tuple[float, int, pathlib.Path]]:
+        for entry in self.__directory.glob("*/*.gz"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Evicted by another worker in the meantime
+                continue
+            yield stat.st_mtime, stat.st_size, entry
+
+    def __evict(self) -> None:
+        """
+        Drop least-recently-used entries until the namespace is back under
+        90% of its budget, so eviction doesn't trigger on every write.
+        """
+        entries = sorted(self.__stat_entries())
+
+        self.__size = sum(size for _, size, _ in entries)
+        target_size = self.max_size * 0.9
+        for _, size, entry in entries:
+            if self.__size <= target_size:
+                break
+            entry.unlink(missing_ok=True)
+            self.__size -= size
+
+    @staticmethod
+    def __to_response(
+        meta: Dict[str, Any], body: bytes, from_cache: bool
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.reason = meta.get("reason", "")
+        response.url = meta["url"]
+        response.headers = requests.structures.CaseInsensitiveDict(meta["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = body
+        response.from_cache = from_cache
+        return response
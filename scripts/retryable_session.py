@@ -5,6 +5,7 @@ import urllib3.util.retry
 
 def retryable_session(
     retries: int = 8,
+    pool_maxsize: int = 10,
 ) -> requests.Session:
     session = requests.Session()
 
@@ -16,7 +17,11 @@ def retryable_session(
         status_forcelist=(500, 502, 504),
     )
 
-    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    # Connections are kept alive per host; pool_maxsize bounds how many
+    # are kept for each one when the session is shared between threads
+    adapter = requests.adapters.HTTPAdapter(
+        max_retries=retry, pool_maxsize=pool_maxsize
+    )
     session.mount("http://", adapter)
     session.mount("https://", adapter)
 
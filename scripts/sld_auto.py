@@ -1,14 +1,35 @@
-import yaml
+import argparse
 from pathlib import Path
-from thefuzz import fuzz
 import ijson
 import requests
 import sys
 
-url = r"https://mtgjson.com/api/v5/SLD.json"
-r = requests.get(url, stream=True)
-uuids = {}
-parser = ijson.parse(r.content)
+from fuzzy_index import FuzzyIndex
+from yaml_files import PendingWrites
+
+arg_parser = argparse.ArgumentParser(
+    description="Match the decks of MTGJSON's SLD set to Secret Lair products."
+)
+arg_parser.add_argument(
+    "--sld-json",
+    type=Path,
+    metavar="PATH",
+    help="Read a local SLD.json instead of downloading it.",
+)
+arg_parser.add_argument(
+    "--batch",
+    action="store_true",
+    help="Print the best match of every unmapped deck, with its score and "
+         "margin over the second best, without prompting or writing anything.",
+)
+args = arg_parser.parse_args()
+
+if args.sld_json:
+    sld_json = args.sld_json.read_bytes()
+else:
+    url = r"https://mtgjson.com/api/v5/SLD.json"
+    sld_json = requests.get(url).content
+parser = ijson.parse(sld_json)
 
 decks = []
 
@@ -24,8 +45,12 @@ for prefix, event, value in parser:
     elif prefix == "data.decks.item.sideBoard.item.count" and event == "number":
         decks[-1]["count"] += int(value)
 
-with open("data/contents/SLD.yaml", 'r') as sfile:
-    sld_products = yaml.safe_load(sfile)
+# Picks are kept in memory and written once when the session ends, even
+# when it ends on EOF, Ctrl-C or a SIGTERM/SIGHUP
+sld_path = Path("data/contents/SLD.yaml")
+pending = PendingWrites()
+pending.flush_at_exit()
+sld_products = pending.load(sld_path)
 
 product_names = list(sld_products["products"].keys())
 mapped_decks = {}
@@ -34,6 +59,26 @@ for k, v in sld_products["products"].items():
         for dk in v["deck"]:
             mapped_decks[dk["name"]] = k
 
+# Built once: products by lowercased name for typed names, and the fuzzy
+# index the suggestions come from
+names_by_lower = {name.lower(): name for name in product_names}
+fuzzy_index = FuzzyIndex()
+for name in product_names:
+    fuzzy_index.add(name, sld_path)
+
+if args.batch:
+    unmapped = [deck for deck in decks if deck["name"] not in mapped_decks]
+    matches = fuzzy_index.top_batch([deck["name"] for deck in unmapped], 2)
+    for deck, ranked in zip(unmapped, matches):
+        if not ranked:
+            print(f"[  -/  -] {deck['name']!r} ({deck['count']} cards) -> no product")
+            continue
+        best_score, best = ranked[0]
+        margin = best_score - (ranked[1][0] if len(ranked) > 1 else 0)
+        print(f"[{best_score:>3}/{margin:>3}] {deck['name']!r} ({deck['count']} cards) -> {best[0]!r}")
+    print(f"\n{len(unmapped)} unmapped of {len(decks)} decks")
+    sys.exit(0)
+
 index = 0
 offset = 0
 while index < len(decks):
@@ -44,9 +89,9 @@ while index < len(decks):
         continue
 
     print(f"Finding similar products for {deck['name']}")
-    product_names.sort(key=lambda x: fuzz.token_sort_ratio(x, deck["name"]), reverse=True)
-    for i in range(5):
-        print(f"  {i} - {product_names[i + offset]}")
+    ranked = [product[0] for _, product in fuzzy_index.top(deck["name"], offset + 5)]
+    for i in range(min(5, len(ranked) - offset)):
+        print(f"  {i} - {ranked[i + offset]}")
     
     try:
         product_check = input("Select action ('h' for help): ")
@@ -54,10 +99,11 @@ while index < len(decks):
         sys.exit(1)
     
     # Look for the product name itself
-    for i in range(len(product_names)):
-        if product_check.strip().lower() == product_names[i].lower():
-            product_check = "0"
-            offset = i
+    exact = names_by_lower.get(product_check.strip().lower())
+    if exact is not None:
+        product_check = "0"
+        offset = 0
+        ranked = [exact]
 
     if product_check == "q":
         break
@@ -80,7 +126,11 @@ while index < len(decks):
             product_check = "0"
 
         check_index = int(product_check) + offset
-        p_name = product_names[check_index]
+        if check_index >= len(ranked):
+            print(f"NOTE: Selection out of range, max index is {len(ranked) - 1}")
+            index -= 1
+            continue
+        p_name = ranked[check_index]
         if isinstance(sld_products["products"][p_name], list):
             sld_products["products"][p_name] = {}
         if "card_count" in sld_products["products"][p_name]:
@@ -102,6 +152,7 @@ while index < len(decks):
         if ("card" not in sld_products["products"][p_name]) and ("pack" not in sld_products["products"][p_name]) and ("variable" not in sld_products["products"][p_name]):
             sld_products["products"][p_name]["other"] = [{"name": "Bonus card unknown"}]
 
+        pending.save(sld_path, sld_products)
         print(sld_products["products"][p_name])
     else:
         index -= 1
@@ -112,5 +163,3 @@ while index < len(decks):
     if product_check not in "mb":
         offset = 0
 
-with open("data/contents/SLD.yaml", 'w') as sfile:
-    yaml.dump(sld_products, sfile)
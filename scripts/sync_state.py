@@ -0,0 +1,120 @@
+"""
+State carried by the load_new_products providers from one run to the next
+(ETags, Last-Modified dates, per-group modification dates and the products
+they yielded), so that a provider can fetch only what changed since its last
+run and reuse the rest.
+
+It lives in caches/, out of the committed outputs; the daily workflow keeps
+the directory between runs as a CI cache. What the incremental checks read
+is saved in state.json, and the product lists to reuse go separately to
+products.json: every "products" list of a provider's state is moved there
+on save and put back on load. Both files carry the generation they were
+saved in, and a mismatched pair is ignored as a whole.
+
+Every provider still fully resyncs once its last full sync is older than
+FULL_SYNC_INTERVAL, as incremental syncs can only see the changes a
+marketplace advertises, and --full forces it for all of them.
+"""
+
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+SYNC_STATE_DIR = Path("caches/marketplace_sync")
+FULL_SYNC_INTERVAL = timedelta(days=7)
+
+
+def split_products(value):
+    """`value` without its "products" lists, and those lists in a structure
+    mirroring it (None when there are none)."""
+    if not isinstance(value, dict):
+        return value, None
+    stripped, products = {}, {}
+    for key, item in value.items():
+        if key == "products":
+            products[key] = item
+            continue
+        stripped[key], item_products = split_products(item)
+        if item_products is not None:
+            products[key] = item_products
+    return stripped, products or None
+
+
+def merge_products(value, products):
+    if not isinstance(value, dict) or not products:
+        return value
+    merged = {key: merge_products(item, products.get(key)) for key, item in value.items()}
+    if "products" in products:
+        merged["products"] = products["products"]
+    return merged
+
+
+class SyncState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = {}
+        self.current = {}
+        self.full = False
+        self.full_syncs = set()
+
+    def load(self, directory=SYNC_STATE_DIR, full=False):
+        """Read the state saved by the previous run; with `full`, every
+        provider starts from scratch. Either way providers that don't run
+        this time keep their state."""
+        self.previous = {}
+        state_path = directory.joinpath("state.json")
+        products_path = directory.joinpath("products.json")
+        if state_path.is_file() and products_path.is_file():
+            with open(state_path) as state_file:
+                state = json.load(state_file)
+            with open(products_path) as products_file:
+                products = json.load(products_file)
+            if state.get("generation") and state.get("generation") == products.get("generation"):
+                self.previous = {
+                    provider: merge_products(provider_state, products["providers"].get(provider))
+                    for provider, provider_state in state["providers"].items()
+                }
+        self.current = dict(self.previous)
+        self.full = full
+        self.full_syncs = set()
+
+    def begin(self, provider):
+        """The state `provider` saved last run, or {} when it must fully resync."""
+        state = self.previous.get(provider, {})
+        if self.full or time.time() - state.get("full_sync_at", 0) > FULL_SYNC_INTERVAL.total_seconds():
+            with self.lock:
+                self.full_syncs.add(provider)
+            return {}
+        return state
+
+    def commit(self, provider, state):
+        """Record the state of a successful sync of `provider`."""
+        with self.lock:
+            if provider in self.full_syncs:
+                state["full_sync_at"] = time.time()
+            else:
+                state["full_sync_at"] = self.previous[provider]["full_sync_at"]
+            self.current[provider] = state
+
+    def save(self, directory=SYNC_STATE_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+        generation = uuid.uuid4().hex
+        state = {"generation": generation, "providers": {}}
+        products = {"generation": generation, "providers": {}}
+        for provider, provider_state in self.current.items():
+            state["providers"][provider], provider_products = split_products(provider_state)
+            if provider_products is not None:
+                products["providers"][provider] = provider_products
+
+        # Products first: a state.json without its products.json is ignored
+        with open(directory.joinpath("products.json"), "w") as products_file:
+            json.dump(products, products_file)
+        with open(directory.joinpath("state.json"), "w") as state_file:
+            json.dump(state, state_file, indent=1, sort_keys=True)
+        print(
+            f"Synced {len(self.full_syncs)} provider(s) fully: "
+            f"{', '.join(sorted(self.full_syncs)) or 'none'}"
+        )
@@ -0,0 +1,132 @@
+"""
+Matching of product names against the scrapers' skip lists.
+
+A TagMatcher compiles its whole list into one regular expression, so a name
+is lowercased once and scanned once, instead of once per tag. SkipRules
+combines a scraper's matchers (skip tags, Secret Lair tags and "Full Set"
+exceptions), tells which rule rejected a name, and counts how often every
+rule fired in skip_stats, so that filters that never fire stand out.
+"""
+
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Iterable, Optional, Union
+
+
+class TagMatcher:
+    def __init__(self, tags: Iterable[str], ignore_case: bool = True) -> None:
+        self.ignore_case = ignore_case
+        # Matched text -> tag as listed
+        self.tags = {(tag.lower() if ignore_case else tag): tag for tag in tags}
+        # At any position the first alternative wins, so longer tags go first
+        # to report the most specific one
+        self.__pattern = (
+            re.compile(
+                "|".join(
+                    re.escape(tag) for tag in sorted(self.tags, key=lambda tag: (-len(tag), tag))
+                )
+            )
+            if self.tags
+            else None
+        )
+
+    def match(self, name: str) -> Optional[str]:
+        """The first tag appearing in `name`, or None."""
+        if self.__pattern is None:
+            return None
+        found = self.__pattern.search(name.lower() if self.ignore_case else name)
+        return self.tags[found.group()] if found else None
+
+    def search(self, name: str) -> bool:
+        """Whether any of the tags appears in `name`."""
+        return self.match(name) is not None
+
+
+Tags = Union[TagMatcher, Iterable[str]]
+
+
+def compile_tags(tags: Optional[Tags]) -> Optional[TagMatcher]:
+    if tags is None or isinstance(tags, TagMatcher):
+        return tags
+    return TagMatcher(tags)
+
+
+class SkipStats:
+    """How many names each provider's skip rules rejected, per rule."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(Counter)
+
+    def register(self, provider, rules):
+        with self.lock:
+            for rule in rules:
+                self.counts[provider][rule] += 0
+
+    def record(self, provider, rule):
+        with self.lock:
+            self.counts[provider][rule] += 1
+
+    def report(self):
+        print("Skip rule summary:")
+        for provider in sorted(self.counts):
+            counts = self.counts[provider]
+            print(f"  {provider}: {sum(counts.values())} skipped")
+            for rule, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+                print(f"    {count:>6}  {rule}{'  (never fired)' if not count else ''}")
+
+
+skip_stats = SkipStats()
+
+
+class SkipRules:
+    """
+    A scraper's product name filters, checked in this order:
+      - names containing one of `tags`
+      - names containing "Full Set" but none of `full_set_ok` (only when
+        `full_set_ok` is given)
+      - Secret Lair names containing one of `sld_tags`
+
+    Lists of tags are matched ignoring case; pass a TagMatcher to match
+    case-sensitively instead.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        tags: Tags = (),
+        sld_tags: Tags = (),
+        full_set_ok: Optional[Tags] = None,
+    ) -> None:
+        self.provider = provider
+        self.tags = compile_tags(tags)
+        self.sld_tags = compile_tags(sld_tags)
+        self.full_set_ok = compile_tags(full_set_ok)
+
+        rules = [f"tag {tag!r}" for tag in self.tags.tags.values()]
+        rules += [f"secret lair tag {tag!r}" for tag in self.sld_tags.tags.values()]
+        if self.full_set_ok is not None:
+            rules.append("full set")
+        skip_stats.register(provider, rules)
+
+    def check(self, name: str) -> Optional[str]:
+        """The rule rejecting `name`, or None if it is kept."""
+        rule = None
+        tag = self.tags.match(name)
+        if tag is not None:
+            rule = f"tag {tag!r}"
+        elif (
+            self.full_set_ok is not None
+            and "Full Set" in name
+            and not self.full_set_ok.search(name)
+        ):
+            rule = "full set"
+        elif "Secret Lair" in name:
+            tag = self.sld_tags.match(name)
+            if tag is not None:
+                rule = f"secret lair tag {tag!r}"
+
+        if rule is not None:
+            skip_stats.record(self.provider, rule)
+        return rule
@@ -4,7 +4,9 @@ import lzma
 import pathlib
 import tempfile
 from collections import defaultdict
-from typing import Dict, Any, Set, List
+from typing import Dict, Any, Set, List, Iterator, Optional, Tuple
+
+import ijson
 
 from ..retryable_session import retryable_session
 
@@ -12,13 +14,20 @@ from ..retryable_session import retryable_session
 class AllPrintings:
     __temp_file: pathlib.Path
     __temp_file_data: Any
+    __owns_file: bool
 
-    def __init__(self) -> None:
-        self.__temp_file = self.__download_all_printings()
-        self.__temp_file_data = self.__read_all_printings()
+    def __init__(self, path: Optional[pathlib.Path] = None, load: bool = True) -> None:
+        """
+        :param path: Local AllPrintings.json to use instead of downloading one
+        :param load: Parse the whole file up front; streaming callers don't need to
+        """
+        self.__owns_file = path is None
+        self.__temp_file = self.__download_all_printings() if path is None else path
+        self.__temp_file_data = self.__read_all_printings() if load else None
 
     def __del__(self) -> None:
-        self.__temp_file.unlink()
+        if self.__owns_file:
+            self.__temp_file.unlink()
 
     @staticmethod
     def __download_all_printings() -> pathlib.Path:
@@ -46,6 +55,20 @@ class AllPrintings:
         with self.__temp_file.open("r", encoding="utf8") as f:
             return json.load(f)
 
+    def iterate_sets(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream (set code, set data) pairs without holding the whole file in memory
+        """
+        with self.__temp_file.open("rb") as f:
+            yield from ijson.kvitems(f, "data", use_float=True)
+
+    def read_meta(self) -> Optional[Dict[str, Any]]:
+        """
+        The file's "meta" object, read without parsing the sets when it comes first
+        """
+        with self.__temp_file.open("rb") as f:
+            return next(ijson.items(f, "meta", use_float=True), None)
+
     def create_mapping_mtgjson_set_code_to_tcgplayer_group_ids(
         self,
     ) -> Dict[str, Set[int]]:
@@ -0,0 +1,78 @@
+"""
+Benchmark for TcgplayerTokenParser over a recorded TCGplayer catalog dump.
+
+Record a dump once (needs TCGPLAYER_CLIENT_ID/TCGPLAYER_CLIENT_SECRET):
+    python -m scripts.tokens.benchmark_token_parser --record dump.json 1163 17666
+
+Then benchmark it offline, as many times as needed:
+    python -m scripts.tokens.benchmark_token_parser dump.json --repeat 6
+
+--repeat simulates a group shared by several parent sets (1163 is added to
+six of them), which is where the memoized parse pays off.
+"""
+
+import argparse
+import json
+import pathlib
+import time
+from typing import Any, Dict, List
+
+from .tcgplayer_provider import TcgplayerProvider
+from .tcgplayer_token_parser import TcgplayerTokenParser
+
+
+def record(dump_path: pathlib.Path, group_ids: List[int]) -> None:
+    tokens = TcgplayerProvider().get_tokens_from_group_ids(group_ids)
+    with dump_path.open("w", encoding="utf-8") as fp:
+        json.dump(tokens, fp, ensure_ascii=False)
+    print(f"Recorded {len(tokens)} tokens from {len(group_ids)} group(s)")
+
+
+def benchmark(tokens: List[Dict[str, Any]], repeat: int) -> None:
+    # Baseline: a fresh parser per pass, so nothing is shared between sets
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser = TcgplayerTokenParser()
+        for token in tokens:
+            parser.split_tcgplayer_token_faces_details(token)
+    unshared = time.perf_counter() - start
+
+    # What the token run does: one parser for every set
+    start = time.perf_counter()
+    parser = TcgplayerTokenParser()
+    for _ in range(repeat):
+        for token in tokens:
+            parser.split_tcgplayer_token_faces_details(token)
+    shared = time.perf_counter() - start
+
+    parsed = len(tokens) * repeat
+    print(f"{len(tokens)} tokens x {repeat} pass(es)")
+    print(f"  per-pass parser: {unshared:.3f}s ({parsed / unshared:,.0f} tokens/s)")
+    print(
+        f"  shared parser:   {shared:.3f}s ({parsed / shared:,.0f} tokens/s),"
+        f" {parser.cache_hits} memoized"
+    )
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("dump", type=pathlib.Path, help="Catalog dump (JSON list)")
+    arg_parser.add_argument(
+        "group_ids", type=int, nargs="*", help="Group ids to record with --record"
+    )
+    arg_parser.add_argument(
+        "--record", action="store_true", help="Download the groups into the dump"
+    )
+    arg_parser.add_argument("--repeat", type=int, default=6)
+    args = arg_parser.parse_args()
+
+    if args.record:
+        record(args.dump, args.group_ids)
+        return
+
+    with args.dump.open("r", encoding="utf-8") as fp:
+        benchmark(json.load(fp), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
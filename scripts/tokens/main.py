@@ -1,3 +1,5 @@
+import argparse
+import hashlib
 import json
 from collections import defaultdict
 
@@ -14,6 +16,32 @@ TCGPLAYER_REFERRAL_URL: str = (
     "https%3A%2F%2Fwww.tcgplayer.com%2Fproduct%2F{}%3Fpage%3D1"
 )
 
+OUTPUT_DIR: pathlib.Path = pathlib.Path("outputs/token_products_mappings")
+FINGERPRINTS_PATH: pathlib.Path = pathlib.Path(
+    "outputs/token_products_mappings_fingerprints.json"
+)
+
+# TCGplayer extendedData entries the token filter and parser read
+TCGPLAYER_TOKEN_FINGERPRINT_EXTENDED_DATA = (
+    "Number",
+    "Rarity",
+    "SubType",
+)
+
+# Bump whenever a change to the matching rules should rebuild every set
+MAPPING_VERSION: int = 1
+
+# MTGJSON token fields the mapper looks at; anything else can't change the output
+MTGJSON_TOKEN_FINGERPRINT_FIELDS = (
+    "uuid",
+    "name",
+    "faceName",
+    "number",
+    "layout",
+    "side",
+    "type",
+)
+
 
 def import_overrides() -> Dict[str, List[Dict[str, Any]]]:
     """
@@ -181,14 +209,75 @@ def build_tokens_mapping(
     return filtered
 
 
+def compute_set_fingerprint(
+    mtgjson_tokens: Dict[str, List[Dict[str, Any]]],
+    tcgplayer_tokens: List[Dict[str, Any]],
+    set_overrides: Dict[str, List[Dict[str, Any]]],
+) -> str:
+    """
+    Fingerprint everything a set's mapping is built from: the MTGJSON tokens,
+    the TCGplayer products (their modifiedOn date, and the name and
+    extendedData entries the parser reads, in case an edit doesn't bump it)
+    and the manual overrides.
+    """
+    inputs = {
+        "version": MAPPING_VERSION,
+        "mtgjson": {
+            set_code: [
+                [token.get(field) for field in MTGJSON_TOKEN_FINGERPRINT_FIELDS]
+                for token in tokens
+            ]
+            for set_code, tokens in mtgjson_tokens.items()
+        },
+        "tcgplayer": sorted(
+            [
+                token["productId"],
+                token.get("modifiedOn"),
+                token.get("name"),
+                sorted(
+                    [entry["name"], entry.get("value")]
+                    for entry in token.get("extendedData", [])
+                    if entry.get("name") in TCGPLAYER_TOKEN_FINGERPRINT_EXTENDED_DATA
+                ),
+            ]
+            for token in tcgplayer_tokens
+        ),
+        "overrides": set_overrides,
+    }
+    return hashlib.sha256(
+        json.dumps(inputs, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def load_fingerprints() -> Dict[str, str]:
+    if not FINGERPRINTS_PATH.exists():
+        return {}
+    with FINGERPRINTS_PATH.open("r") as fp:
+        return json.load(fp)
+
+
+def save_fingerprints(fingerprints: Dict[str, str]) -> None:
+    with FINGERPRINTS_PATH.open("w") as fp:
+        json.dump(fingerprints, fp, indent=4, sort_keys=True)
+
+
 def save_output(parent_set_code: str, output: Dict[str, List[Dict[str, Any]]]) -> None:
-    output_dir = pathlib.Path("outputs/token_products_mappings")
-    output_dir.mkdir(parents=True, exist_ok=True)
-    with output_dir.joinpath(f"{parent_set_code}.json").open("w") as fp:
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    with OUTPUT_DIR.joinpath(f"{parent_set_code}.json").open("w") as fp:
         json.dump(output, fp, indent=4, sort_keys=True)
 
 
 def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Map MTGJSON tokens to TCGplayer products."
+    )
+    arg_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild every set, even those whose inputs are unchanged.",
+    )
+    args = arg_parser.parse_args()
+
     print("Initializing MTGJSON parser...")
     mtgjson_parser = MtgjsonParser()
     print("Initializing TCGplayer provider...")
@@ -198,13 +287,38 @@ def main():
     overrides = import_overrides()
     set_code_mapping = mtgjson_parser.get_codes_to_group_ids_mapping()
     total = len(set_code_mapping)
+
+    all_group_ids = set().union(*set_code_mapping.values())
+    print(f"Fetching {len(all_group_ids)} TCGplayer groups...")
+    tcgplayer_provider.prefetch_group_ids(all_group_ids)
+
     print(f"Processing {total} sets...")
 
+    # Sets no longer in MTGJSON drop out of the fingerprints
+    fingerprints = {} if args.full else {
+        set_code: fingerprint
+        for set_code, fingerprint in load_fingerprints().items()
+        if set_code in set_code_mapping
+    }
+    rebuilt = 0
+
     for i, (set_code, group_ids) in enumerate(set_code_mapping.items(), 1):
         print(f"[{i}/{total}] Processing {set_code} (group IDs: {group_ids})")
         mtgjson_tokens = mtgjson_parser.get_associated_mtgjson_tokens(set_code)
         tcgplayer_tokens = tcgplayer_provider.get_tokens_from_group_ids(group_ids)
 
+        fingerprint = compute_set_fingerprint(
+            mtgjson_tokens, tcgplayer_tokens, overrides.get(set_code, {})
+        )
+        if (
+            fingerprints.get(set_code) == fingerprint
+            and OUTPUT_DIR.joinpath(f"{set_code}.json").exists()
+        ):
+            print("  Inputs unchanged, skipping")
+            continue
+        fingerprints[set_code] = fingerprint
+        rebuilt += 1
+
         output_token_mapping = build_tokens_mapping(
             set_code, mtgjson_tokens, tcgplayer_tokens, tcgplayer_token_parser
         )
@@ -214,8 +328,11 @@ def main():
             save_output(set_code, output_token_mapping)
             print(f"  Saved {len(output_token_mapping)} token mapping(s)")
         else:
-            print(f"  No token mappings found, skipping")
+            print("  No token mappings found, skipping")
 
+    save_fingerprints(fingerprints)
+    print(f"Rebuilt {rebuilt}/{total} sets")
+    print(f"Reused {tcgplayer_token_parser.cache_hits} memoized token parse(s)")
     print("Done!")
 
 
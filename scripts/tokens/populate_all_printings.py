@@ -3,11 +3,17 @@ This is a helper script that can be used to identify what token(s) might be miss
 MTGJSON data set and can be either corrected for within code or manually overwritten in the
 data/token_manual_overrides.json file.
 
+AllPrintings is streamed one set at a time, and the missing token report is built in that
+same pass. The enriched AllPrintings (every token with its tokenProducts) is only written
+when asked for with --enhanced.
+
 Make sure the working directory is Repo Root (probably "mtg-sealed-content")
 """
 
+import argparse
 import json
 import pathlib
+from typing import Any, Dict, Optional, TextIO
 
 from .all_printings import AllPrintings
 
@@ -15,61 +21,105 @@ ENHANCED_ALL_PRINTINGS_PATH = pathlib.Path(
     "outputs/AllPrintings_withTokenParts_temporary.json"
 )
 MISSING_TXT_PATH = pathlib.Path("outputs/missing_tokenParts.txt")
-
-
-def populate_temporary_enhanced_all_printings():
-    all_printings = AllPrintings()
-
-    data = all_printings.get_data()
-    for set_code, set_data in data.get("data").items():
-        code_to_use = (
-            set_code if "parentCode" not in set_data else set_data["parentCode"]
-        )
-
-        token_struct_path = pathlib.Path(
-            f"outputs/token_products_mappings/{code_to_use}.json"
-        )
-        if not token_struct_path.exists():
-            print(f"Skipping {set_code} ({code_to_use})")
-            continue
-
-        with token_struct_path.open("r") as fp:
-            token_data_mapping = json.load(fp)
-
-        print(f"Working on {set_code} ({code_to_use})")
-        for index, token_details in enumerate(set_data.get("tokens", [])):
-            if token_details["uuid"] in token_data_mapping:
-                set_data["tokens"][index]["tokenProducts"] = token_data_mapping[
-                    token_details["uuid"]
-                ]
-
-    with ENHANCED_ALL_PRINTINGS_PATH.open("w") as fp:
-        json.dump(data, fp, indent=4, ensure_ascii=False, sort_keys=True)
-
-
-def populate_missing_txt():
-    with ENHANCED_ALL_PRINTINGS_PATH.open("r") as fp:
-        data = json.load(fp)
-
-    with MISSING_TXT_PATH.open("w") as fp:
-        found = 0
-        missing = 0
-        for set_code, set_data in data.get("data").items():
+TOKEN_MAPPINGS_DIR = pathlib.Path("outputs/token_products_mappings")
+
+
+def load_token_mapping(
+    code: str, cache: Dict[str, Optional[Dict[str, Any]]]
+) -> Optional[Dict[str, Any]]:
+    # Child sets share their parent's file, so each file is only parsed once
+    if code not in cache:
+        token_struct_path = TOKEN_MAPPINGS_DIR.joinpath(f"{code}.json")
+        if token_struct_path.exists():
+            with token_struct_path.open("r") as fp:
+                cache[code] = json.load(fp)
+        else:
+            cache[code] = None
+    return cache[code]
+
+
+def indented_json(value: Any, level: int) -> str:
+    # What json.dump(indent=4) writes for `value` nested `level` objects deep;
+    # JSON strings can't hold a raw newline, so every newline is layout
+    return json.dumps(value, indent=4, ensure_ascii=False, sort_keys=True).replace(
+        "\n", "\n" + " " * 4 * level
+    )
+
+
+def populate(all_printings: AllPrintings, enhanced_fp: Optional[TextIO]) -> None:
+    token_mappings: Dict[str, Optional[Dict[str, Any]]] = {}
+    found = 0
+    missing = 0
+    set_count = 0
+
+    if enhanced_fp:
+        enhanced_fp.write('{\n    "data": {')
+
+    with MISSING_TXT_PATH.open("w") as missing_fp:
+        for set_code, set_data in all_printings.iterate_sets():
             parent_set_code = set_data.get("parentCode", set_data.get("code"))
-            for index, token_details in enumerate(set_data.get("tokens", [])):
-                if "tokenProducts" in token_details:
+            token_data_mapping = load_token_mapping(parent_set_code, token_mappings)
+            if token_data_mapping is None:
+                print(f"Skipping {set_code} ({parent_set_code})")
+            else:
+                print(f"Working on {set_code} ({parent_set_code})")
+
+            for token_details in set_data.get("tokens", []):
+                if token_data_mapping and token_details["uuid"] in token_data_mapping:
+                    token_details["tokenProducts"] = token_data_mapping[
+                        token_details["uuid"]
+                    ]
                     found += 1
                     continue
                 # UUID, Parent Set Code, Set Code, Name, Number, Side
-                fp.write(
+                missing_fp.write(
                     f"{token_details['uuid']}, {parent_set_code}, {set_code}, \"{token_details['name']}\", {token_details['number']}, {token_details.get('side', 'NO_SIDE')}\n"
                 )
                 missing += 1
-        fp.write(
+
+            if enhanced_fp:
+                enhanced_fp.write(
+                    f"{',' if set_count else ''}\n        "
+                    f"{indented_json(set_code, 2)}: {indented_json(set_data, 2)}"
+                )
+            set_count += 1
+
+        missing_fp.write(
             f"\nFound {found}/{found + missing} ({found / (found + missing) * 100}%) tokens"
         )
 
+    if enhanced_fp:
+        # Laid out like the json.dump(indent=4, sort_keys=True) of the whole
+        # document, with the source's "meta" so it stays a valid AllPrintings
+        enhanced_fp.write("\n    }" if set_count else "}")
+        meta = all_printings.read_meta()
+        if meta is not None:
+            enhanced_fp.write(f',\n    "meta": {indented_json(meta, 1)}')
+        enhanced_fp.write("\n}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--all-printings",
+        type=pathlib.Path,
+        help="Local AllPrintings.json to use instead of downloading it",
+    )
+    parser.add_argument(
+        "--enhanced",
+        action="store_true",
+        help=f"Also write the enriched AllPrintings to {ENHANCED_ALL_PRINTINGS_PATH}",
+    )
+    args = parser.parse_args()
+
+    all_printings = AllPrintings(args.all_printings, load=False)
+    if not args.enhanced:
+        populate(all_printings, None)
+        return
+
+    with ENHANCED_ALL_PRINTINGS_PATH.open("w", encoding="utf-8") as enhanced_fp:
+        populate(all_printings, enhanced_fp)
+
 
 if __name__ == "__main__":
-    populate_temporary_enhanced_all_printings()
-    populate_missing_txt()
+    main()
@@ -1,23 +1,32 @@
+import datetime
 import itertools
 import json
-import multiprocessing
 import os
-import pathlib
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Iterable, List
 
 import requests
 
+from ..response_cache import ResponseCache
 from ..retryable_session import retryable_session
 
 
 class TcgplayerProvider:
     __session: requests.Session
+    __cache: ResponseCache
+    __group_tokens: Dict[int, List[Dict[str, Any]]]
 
     def __init__(self) -> None:
         self.__session = retryable_session()
         self.__session.headers.update(
             {"Authorization": f"Bearer {self.__get_tcgplayer_auth_token()}"}
         )
+        # Pages used to be kept forever; they now expire after a day (then
+        # revalidate), so that products TCGplayer edits reach the mappings
+        self.__cache = ResponseCache(
+            "tcgplayer", self.__session, expire_after=datetime.timedelta(days=1)
+        )
+        self.__group_tokens = {}
 
     @staticmethod
     def __get_tcgplayer_auth_token():
@@ -49,27 +58,12 @@ class TcgplayerProvider:
             ) from exception
 
     def download(self, url: str, params: Dict[str, Any]):
-        cache_path = pathlib.Path(
-            f"caches/tcgplayer/{params['groupId']}-{params['offset']}.json"
-        )
-        cache_path.parent.mkdir(parents=True, exist_ok=True)
-        if cache_path.exists():
-            # print(f"Using cached response for {url} with params {params}")
-            with cache_path.open("r") as fp:
-                return json.load(fp)
-
-        print(f"Downloading {url} with params {params}")
-        response = self.__session.get(url, params=params)
-        response_decoded = response.content.decode()
+        response = self.__cache.get(url, params=params)
+        if not response.from_cache:
+            print(f"Downloaded {url} with params {params}")
 
         try:
-            response = json.loads(response_decoded)
-            results = list(response.get("results", []))
-
-            with cache_path.open("w") as fp:
-                json.dump(results, fp, indent=4, ensure_ascii=False, sort_keys=True)
-            return results
-
+            return list(json.loads(response.content.decode()).get("results", []))
         except json.decoder.JSONDecodeError:
             return []
 
@@ -83,35 +77,52 @@ class TcgplayerProvider:
     ) -> List[Dict[str, Any]]:
         max_api_offset = api_offset + threads * offsets_per_thread
 
-        args = [
-            (url, {**params, "offset": offset})
-            for offset in range(api_offset, max_api_offset, offsets_per_thread)
-        ]
-
-        with multiprocessing.Pool(processes=threads) as pool:
-            starmap_results = pool.starmap(self.download, args)
+        offsets = range(api_offset, max_api_offset, offsets_per_thread)
 
-        results = list(itertools.chain.from_iterable(starmap_results))
+        # Page downloads are I/O bound and share the cache, so threads do;
+        # worker processes would each get a pickled copy of the provider
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            pages = executor.map(
+                lambda offset: self.download(url, {**params, "offset": offset}),
+                offsets,
+            )
+            results = list(itertools.chain.from_iterable(pages))
         if not results:
             return []
 
         return results + self.download_exhaustive(url, params, max_api_offset)
 
+    def prefetch_group_ids(self, group_ids: Iterable[int]) -> None:
+        """
+        Fetch and filter every distinct group once. Several parent sets share
+        groups (e.g. 1163), and later lookups are then served from memory.
+        :param group_ids: Union of the group ids of every set to process
+        """
+        missing_group_ids = sorted(set(group_ids) - self.__group_tokens.keys())
+        for index, group_id in enumerate(missing_group_ids, 1):
+            print(f"[{index}/{len(missing_group_ids)}] Fetching group {group_id}")
+            self.__load_group_id(group_id)
+
     def get_tokens_from_group_ids(
         self, group_ids: Iterable[int]
     ) -> List[Dict[str, Any]]:
-        cards_and_tokens = []
+        tokens = []
         for group_id in group_ids:
-            cards_and_tokens += self.get_tokens_from_group_id(group_id)
+            if group_id not in self.__group_tokens:
+                self.__load_group_id(group_id)
+            tokens += self.__group_tokens[group_id]
 
+        return tokens
+
+    def __load_group_id(self, group_id: int) -> None:
         tokens = []
-        for card_or_token in cards_and_tokens:
+        for card_or_token in self.get_tokens_from_group_id(group_id):
             for data_entry in card_or_token.get("extendedData", {}):
                 if self.__entry_is_token(card_or_token["name"], data_entry):
                     tokens.append(card_or_token)
                     break
 
-        return tokens
+        self.__group_tokens[group_id] = tokens
 
     def get_tokens_from_group_id(self, group_id: int) -> List[Dict[str, Any]]:
         return self.download_exhaustive(
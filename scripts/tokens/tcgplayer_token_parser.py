@@ -1,6 +1,30 @@
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Optional, Tuple
 import re
 
+# Keyword -> tokenType, in priority order (the first listed keyword found in
+# the name wins, regardless of where it appears in the name)
+TOKEN_TYPE_PRIORITIES: List[Tuple[str, Optional[str]]] = [
+    # Highest priority exceptions (Punch/Minigame usually override)
+    ("punch", "Punch"),
+    ("magic minigame", "Minigame"),
+    # Specific token card types
+    ("decklist", "Decklist"),
+    ("bio", "Bio"),
+    ("theme", "Theme"),
+    ("art", "Art"),
+    ("helper", "Helper"),
+    ("world championship", "WorldChampionship"),
+    # Tokens/Emblems (the general case)
+    ("token", "Token"),
+    ("emblem", "Token"),
+    # Not a type, but found by the same scan
+    ("gold-stamped", None),
+]
+# Zero-width lookahead so overlapping keywords are all reported in one scan
+KEYWORD_REGEX: re.Pattern = re.compile(
+    "(?=(" + "|".join(re.escape(k) for k, _ in TOKEN_TYPE_PRIORITIES) + "))"
+)
+
 
 class TcgplayerTokenParser:
     __emblem_regex: re.Pattern
@@ -8,6 +32,8 @@ class TcgplayerTokenParser:
     __treatment_single_side_regex: re.Pattern
     __treatment_double_side_regex: re.Pattern
     __role_regex: re.Pattern
+    __parsed: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]]
+    cache_hits: int
 
     def __init__(self) -> None:
         """
@@ -30,6 +56,11 @@ class TcgplayerTokenParser:
         )
         self.__role_regex = re.compile(r"(.*) Role / (.*) Role")
 
+        # The same products show up in several parent sets (e.g. group 1163),
+        # so each distinct product is only parsed once per run
+        self.__parsed = {}
+        self.cache_hits = 0
+
     def __fix_emblem_names(self, token) -> str:
         if match := self.__emblem_regex.match(token):
             return match.group(1) + " Emblem"
@@ -88,40 +119,50 @@ class TcgplayerTokenParser:
         """
         additional: Dict[str, str | list[str]] = {}
 
-        token_type_priorities: list[tuple[str, str]] = [
-            # Highest priority exceptions (Punch/Minigame usually override)
-            ("punch", "Punch"),
-            ("magic minigame", "Minigame"),
-            # Specific token card types
-            ("decklist", "Decklist"),
-            ("bio", "Bio"),
-            ("theme", "Theme"),
-            ("art", "Art"),
-            ("helper", "Helper"),
-            ("world championship", "WorldChampionship"),
-            # Tokens/Emblems (the general case)
+        keywords = set(KEYWORD_REGEX.findall(tcgplayer_token_name_lower))
+        token_types = [
+            token_type
+            for keyword, token_type in TOKEN_TYPE_PRIORITIES
+            if token_type and keyword in keywords
         ]
+        if token_types:
+            additional["tokenType"] = token_types[0]
 
-        for keyword, token_type in token_type_priorities:
-            if keyword in tcgplayer_token_name_lower:
-                additional["tokenType"] = token_type
-                break
-
-        if "tokenType" not in additional and any(
-            x in tcgplayer_token_name_lower for x in ["token", "emblem"]
-        ):
-            additional["tokenType"] = "Token"
-
-        if "gold-stamped" in tcgplayer_token_name_lower:
-            if "faceAttribute" not in additional:
-                additional["faceAttribute"] = []
-            additional["faceAttribute"].append("Gold Stamped")
+        if "gold-stamped" in keywords:
+            additional["faceAttribute"] = ["Gold Stamped"]
 
         return additional
 
     def split_tcgplayer_token_faces_details(
         self,
         tcgplayer_token: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        """
+        Memoized on the product name and collector number, the only inputs
+        of the parse. Callers get their own copies, as the face details are
+        annotated in place later on.
+        """
+        key = (
+            tcgplayer_token["name"],
+            tuple(
+                entry["value"]
+                for entry in tcgplayer_token["extendedData"]
+                if entry["name"] == "Number"
+            ),
+        )
+        if key in self.__parsed:
+            self.cache_hits += 1
+        else:
+            self.__parsed[key] = self.__split_token_faces_details(tcgplayer_token)
+
+        return [
+            {k: list(v) if isinstance(v, list) else v for k, v in face.items()}
+            for face in self.__parsed[key]
+        ]
+
+    def __split_token_faces_details(
+        self,
+        tcgplayer_token: Dict[str, Any],
     ) -> List[Dict[str, Any]]:
         token_face_names = self.__get_token_face_names(tcgplayer_token["name"])
         first_face_id, second_face_id = None, None
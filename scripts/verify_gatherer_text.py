@@ -0,0 +1,270 @@
+"""
+Check that gatherer_text cleans Gatherer's printed texts and type lines
+exactly like the original transform chain did (kept below as the
+reference), and measure how many cards per second each one cleans.
+
+The committed golden corpus (fixtures/gatherer_text_corpus.json) holds
+raw instanceText/instanceTypeLine values with what the original chain
+turned them into, so the check means something on a clean checkout; it
+fails when the corpus is missing. On top of it, the cleanup is compared
+with the reference chain over every card page in the Gatherer response
+cache and in the recorded fixtures, the texts of the per-set dumps
+(already cleaned, but still full of " // " and markup-free text to go
+through), and a set of hand-written edge cases:
+    python scripts/verify_gatherer_text.py
+
+The golden outputs are only ever produced by the reference chain. To add
+a random sample of the cached card pages to the corpus and recompute them:
+    python scripts/verify_gatherer_text.py --update-corpus --sample 200
+
+Exits non-zero when any output differs.
+"""
+
+import argparse
+import gzip
+import json
+import pathlib
+import random
+import re
+import sys
+import time
+
+import bs4
+import requests
+
+from gatherer_original_printing_details_generator import FIXTURES_DIR, GathererDownloader
+from gatherer_text import clean_original_text, clean_original_type
+from replay_server import Uncached
+from response_cache import CACHE_ROOT
+
+CORPUS_PATH = FIXTURES_DIR.joinpath("gatherer_text_corpus.json")
+
+EDGE_CASES = [
+    ("Flying\\nWhen this enters, draw a card.", "Creature \\u2014 Bird"),
+    ('Tap: Add oW or o2oG. \\"Quoted\\"', "Artifact"),
+    ("Deal 3 damage.\\n//ADV//\\nStomp\\n{1}{R}\\nInstant\\nDamage can't be prevented.", "Creature"),
+    ("Omen text\\n//OMEN//\\nName\\n{2}\\nSorcery\\nShuffle.", "Creature"),
+    ("Fire\\n///\\n{1}{R}\\nInstant\\nFire deals 2 damage.//\\nFuse", "Instant // Instant"),
+    ("Open the door.\\n//\\nName\\nEnchantment\\nUnlock this door.//More", "Enchantment \\u2014 Room"),
+    ("//Level_1//\\nFirst\\n//Level_2//\\nSecond", "Enchantment \\u2014 Class"),
+    ("Left\\n//\\nRight\\n{U}\\nInstant\\nRight text.", "Instant // Instant"),
+    ("<i>(Reminder text.)</i> Flying", "<b>Creature</b>"),
+    ("<I>Upper</I> <br/>case", "Type<i\\n>line"),
+    ('<a title="x>y">Attribute</a>', "Artifact"),
+    ("<i>Whitespace</i> \\n <i>between tags</i>", "Creature<i>\t</i>Elf"),
+    ("Unclosed <i>italic", "a<b"),
+    ("x < 3 and y > 2", "1 <2"),
+    ("&amp;amp; double escaped <i>tag</i>", "&foo; <b>q</b>"),
+    ("<!-- comment -->text", "<script>x</script>y"),
+    ("<style>s</style>z", "<template>t</template>u"),
+    ("trailing backslash \\", "\\\\n"),
+    ("", ""),
+]
+
+
+class ReferenceCleanup:
+    """The transforms GathererDownloader used to run, one after the other."""
+
+    def __init__(self) -> None:
+        self.split_card_regex = re.compile(r"(.*?)\n?///?\n(?:.*?\n){3}(.*)", re.DOTALL)
+        self.old_school_mana_regex = re.compile(r"o?o([0-9]+|[WUBRGX])")
+        self.adventure_omen_text_regex = re.compile(
+            r"(.*?)\n?//(?:ADV|OMEN)//\n(?:.*?\n){3}(.*)", re.DOTALL
+        )
+        self.fuse_and_doors_regex = re.compile(
+            r"(.*?)\n?///?\n(?:.*?\n){2}(.*)//\n?(.*)", re.DOTALL
+        )
+
+    def text(self, text: str) -> str:
+        if not text:
+            return ""
+        for func in [
+            self.strip_slashes,
+            self.strip_adventure_or_omen_component,
+            self.strip_fuse_and_doors,
+            self.strip_class_levels,
+            self.strip_split_component,
+            self.fix_old_school_mana,
+            self.strip_html,
+        ]:
+            text = func(text)
+        return text
+
+    def type_line(self, type_line: str) -> str:
+        if not type_line:
+            return ""
+        return self.strip_html(self.strip_slashes(type_line))
+
+    @staticmethod
+    def strip_slashes(card_text: str) -> str:
+        return card_text.replace("\\n", "\n").replace('\\"', '"')
+
+    def strip_adventure_or_omen_component(self, card_text: str) -> str:
+        if "//ADV//" not in card_text and "//OMEN//" not in card_text:
+            return card_text
+        texts = self.adventure_omen_text_regex.findall(card_text)
+        if texts and len(texts[0]) == 2:
+            return f"{texts[0][1]} // {texts[0][0]}"
+        return card_text
+
+    def strip_fuse_and_doors(self, card_text: str) -> str:
+        if "door" not in card_text and "Fuse" not in card_text:
+            return card_text
+        texts = self.fuse_and_doors_regex.findall(card_text)
+        if texts and len(texts[0]) == 3:
+            return f"{texts[0][0]} // {texts[0][1]}{texts[0][2]}"
+        return card_text
+
+    @staticmethod
+    def strip_class_levels(card_text: str) -> str:
+        if "Level_" not in card_text:
+            return card_text
+        return re.sub(r"//Level_[0-9]+//\n", "", card_text)
+
+    def strip_split_component(self, card_text: str) -> str:
+        if "//" not in card_text:
+            return card_text
+        split_texts = self.split_card_regex.findall(card_text)
+        if split_texts and len(split_texts[0]) == 2:
+            return f"{split_texts[0][0]} // {split_texts[0][1]}"
+        return card_text
+
+    def fix_old_school_mana(self, card_text: str) -> str:
+        return self.old_school_mana_regex.sub(r"{\1}", card_text)
+
+    @staticmethod
+    def strip_html(card_text: str) -> str:
+        if "<" not in card_text:
+            return card_text
+        return bs4.BeautifulSoup(card_text, "html.parser").get_text()
+
+
+def page_texts(directories):
+    """(text, type line) of every card page stored under `directories`,
+    as response cache entries or fixtures (both a JSON line, then the body)."""
+    downloader = GathererDownloader(Uncached(requests.Session()))
+    for directory in directories:
+        for path in directory.glob("**/*.gz"):
+            try:
+                _, _, body = gzip.decompress(path.read_bytes()).partition(b"\n")
+                page = downloader._decode_card_response(body)
+            except (OSError, EOFError, UnicodeError):
+                continue
+            details = {}
+            for match in downloader.original_details_regex.finditer(page):
+                details.setdefault(match.group(1), match.group(2))
+            if details:
+                yield details.get("instanceText", ""), details.get("instanceTypeLine", "")
+
+
+def dump_texts(dumps_dir):
+    for path in sorted(dumps_dir.glob("*.json")):
+        with path.open("r", encoding="utf-8") as fp:
+            for value in json.load(fp).values():
+                if isinstance(value, dict):
+                    yield value.get("text", ""), value.get("type", "")
+
+
+def load_corpus(path):
+    """The golden entries: {"text", "type"} raw inputs and their
+    "expected_text" and "expected_type"."""
+    with path.open("r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def update_corpus(path, corpus, pages, sample):
+    """Add `sample` random pages to the corpus at `path` and recompute every
+    expected output with the reference chain."""
+    inputs = {(entry["text"], entry["type"]) for entry in corpus}
+    new_pages = sorted(set(pages) - inputs)
+    inputs.update(random.sample(new_pages, min(sample, len(new_pages))))
+
+    reference = ReferenceCleanup()
+    corpus = [
+        {
+            "text": text,
+            "type": type_line,
+            "expected_text": reference.text(text),
+            "expected_type": reference.type_line(type_line),
+        }
+        for text, type_line in sorted(inputs)
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as fp:
+        json.dump(corpus, fp, indent=1, ensure_ascii=False)
+        fp.write("\n")
+    return corpus
+
+
+def cards_per_second(corpus, clean_text, clean_type, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text, type_line in corpus:
+            clean_text(text)
+            clean_type(type_line)
+    return len(corpus) * repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify and benchmark the Gatherer text cleanup.")
+    parser.add_argument("--cache", type=pathlib.Path, default=CACHE_ROOT.joinpath("gatherer"), help="Gatherer response cache")
+    parser.add_argument("--fixtures", type=pathlib.Path, default=FIXTURES_DIR.joinpath("gatherer"), help="Recorded Gatherer fixtures")
+    parser.add_argument("--dumps", type=pathlib.Path, default=pathlib.Path("dumps"), help="Per-set dumps")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus when benchmarking")
+    parser.add_argument("--show", type=int, default=10, help="Differences to print")
+    parser.add_argument("--corpus", type=pathlib.Path, default=CORPUS_PATH, help="Golden corpus")
+    parser.add_argument("--update-corpus", action="store_true", help="Add sampled pages to the golden corpus and recompute its outputs")
+    parser.add_argument("--sample", type=int, default=0, help="Cached pages to add with --update-corpus")
+    args = parser.parse_args()
+
+    if not args.corpus.is_file() and not args.update_corpus:
+        print(f"Golden corpus {args.corpus} is missing", file=sys.stderr)
+        sys.exit(2)
+    golden = load_corpus(args.corpus) if args.corpus.is_file() else []
+
+    pages = list(page_texts([args.cache, args.fixtures]))
+    if args.update_corpus:
+        golden = update_corpus(args.corpus, golden, pages, args.sample)
+        print(f"Wrote {len(golden)} entries to {args.corpus}")
+
+    differences = 0
+    for entry in golden:
+        for kind, value, expected, actual in (
+            ("text", entry["text"], entry["expected_text"], clean_original_text(entry["text"])),
+            ("type", entry["type"], entry["expected_type"], clean_original_type(entry["type"])),
+        ):
+            if expected != actual:
+                differences += 1
+                if differences <= args.show:
+                    print(f"  golden {kind} {value!r}: expected {expected!r}, got {actual!r}")
+
+    corpus = list(EDGE_CASES) + [(entry["text"], entry["type"]) for entry in golden]
+    dumps = list(dump_texts(args.dumps))
+    corpus += pages + dumps
+    print(
+        f"{len(corpus)} cards: {len(golden)} golden, {len(EDGE_CASES)} edge cases, "
+        f"{len(pages)} pages, {len(dumps)} dump entries"
+    )
+
+    reference = ReferenceCleanup()
+    for text, type_line in corpus:
+        for kind, value, expected, actual in (
+            ("text", text, reference.text(text), clean_original_text(text)),
+            ("type", type_line, reference.type_line(type_line), clean_original_type(type_line)),
+        ):
+            if expected != actual:
+                differences += 1
+                if differences <= args.show:
+                    print(f"  {kind} {value!r}: expected {expected!r}, got {actual!r}")
+    print(f"{differences} difference(s)")
+
+    reference_speed = cards_per_second(corpus, reference.text, reference.type_line, args.repeat)
+    speed = cards_per_second(corpus, clean_original_text, clean_original_type, args.repeat)
+    print(f"Reference: {reference_speed:,.0f} cards/s")
+    print(f"Compiled:  {speed:,.0f} cards/s ({speed / reference_speed:.1f}x)")
+
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    main()
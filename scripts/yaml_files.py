@@ -0,0 +1,125 @@
+"""
+Change-aware reading and writing of the data/ YAML files.
+
+The daily scripts re-serialize data/products and data/contents to keep them
+normalized (sorted keys, consistent formatting). YamlWriter only dumps a file
+when it may not be normalized yet or its data changed, and only writes it when
+the dumped text differs from what is on disk, so untouched files cost neither
+a dump nor a write and don't churn in git.
+
+The hash of every file this writer left normalized is remembered in
+caches/yaml_hashes.json; a file whose bytes still hash the same is known to
+be normalized without dumping it again.
+"""
+
+import atexit
+import hashlib
+import json
+import signal
+import sys
+from pathlib import Path
+
+import yaml
+
+# libyaml's parser is much faster and builds the same data. Dumping keeps
+# the pure Python emitter so the output formatting doesn't change.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+HASHES_PATH = Path("caches/yaml_hashes.json")
+
+
+def load_yaml(raw):
+    return yaml.load(raw, Loader=SafeLoader)
+
+
+class YamlWriter:
+    def __init__(self, hashes_path=HASHES_PATH):
+        self.hashes_path = hashes_path
+        self.hashes = {}
+        if hashes_path.is_file():
+            with open(hashes_path) as hashes_file:
+                self.hashes = json.load(hashes_file)
+        self.changed = []
+        self.dumped = 0
+
+    def is_normalized(self, path, raw):
+        """Whether `raw` (the file's current bytes) is exactly what this writer
+        last left in `path`."""
+        return self.hashes.get(str(path)) == hashlib.sha256(raw).hexdigest()
+
+    def write(self, path, data, raw=None):
+        """Write `data` to `path` unless the serialized text is already there.
+        `raw` is the file's current bytes, if the caller has already read them.
+        Returns whether the file changed."""
+        text = yaml.safe_dump(data).encode("utf-8")
+        self.dumped += 1
+
+        if raw is None and Path(path).is_file():
+            raw = Path(path).read_bytes()
+
+        changed = raw != text
+        if changed:
+            Path(path).write_bytes(text)
+            self.changed.append(str(path))
+        self.hashes[str(path)] = hashlib.sha256(text).hexdigest()
+        return changed
+
+    def save(self):
+        self.hashes_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.hashes_path, "w") as hashes_file:
+            json.dump(self.hashes, hashes_file, indent=1, sort_keys=True)
+
+    def report(self):
+        print(f"Dumped {self.dumped} YAML file(s), {len(self.changed)} changed on disk")
+        for path in sorted(self.changed):
+            print(f"  {path}")
+
+
+def exit_on_signal(signum, frame):
+    # Raising SystemExit unwinds normally, so atexit handlers still run
+    sys.exit(128 + signum)
+
+
+class PendingWrites:
+    """
+    YAML files edited in memory by an interactive session: each is loaded
+    once, and every file that was saved is written back once by flush(),
+    whatever the number of edits.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.dirty = set()
+
+    def exists(self, path):
+        return Path(path) in self.files or Path(path).exists()
+
+    def load(self, path):
+        """The file's current data (including unflushed edits), to be edited
+        in place and passed back to save()."""
+        path = Path(path)
+        if path not in self.files:
+            self.files[path] = load_yaml(path.read_bytes())
+        return self.files[path]
+
+    def save(self, path, data):
+        self.files[Path(path)] = data
+        self.dirty.add(Path(path))
+
+    def flush_at_exit(self):
+        """Flush once the session ends, however it ends: normally, on an
+        uncaught exception, or on SIGINT, SIGTERM or SIGHUP (which would
+        otherwise kill the process without running exit handlers)."""
+        atexit.register(self.flush)
+        for name in ("SIGINT", "SIGTERM", "SIGHUP"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), exit_on_signal)
+
+    def flush(self):
+        for path in sorted(self.dirty):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w") as yaml_file:
+                yaml.dump(self.files[path], yaml_file)
+        if self.dirty:
+            print(f"Wrote {len(self.dirty)} file(s)")
+        self.dirty.clear()